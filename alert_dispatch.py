@@ -0,0 +1,289 @@
+import email
+import queue
+import smtplib
+import socketserver
+import subprocess
+import threading
+import time
+from email.mime.text import MIMEText
+
+AUDIO_FILE = 'alert.wav'
+DIGEST_WINDOW = 2.0  # seconds to keep collecting alerts into one message
+MAX_BATCH = 200
+MAX_PENDING = 10000
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 1.0  # seconds, doubled after each failed attempt
+SMTP_IDLE_TIMEOUT = 60  # seconds before a pooled connection is checked with NOOP
+
+
+class SMTPSession:
+    """One authenticated SMTP connection, reused across sends and reopened when it goes stale."""
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self._conn = None
+        self._key = None
+        self._last_used = 0.0
+
+    @staticmethod
+    def _settings(config):
+        use_ssl = config.get('smtp_ssl', True)
+        port = config.get('smtp_port', 465 if use_ssl else 25)
+        return (config.get('smtp_server', 'smtp.gmail.com'), port, use_ssl,
+                config.get('smtp_starttls', False), config.get('from'), config.get('password'))
+
+    def _connect(self, settings):
+        host, port, use_ssl, starttls, user, password = settings
+        conn = (smtplib.SMTP_SSL if use_ssl else smtplib.SMTP)(host, port, timeout=self.timeout)
+        if starttls and not use_ssl:
+            conn.starttls()
+        if password:
+            conn.login(user, password)
+        return conn
+
+    def _alive(self):
+        if time.monotonic() - self._last_used < SMTP_IDLE_TIMEOUT:
+            return True
+        try:
+            return self._conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, config, message):
+        settings = self._settings(config)
+        if self._conn is not None and (settings != self._key or not self._alive()):
+            self.close()
+        if self._conn is None:
+            self._conn = self._connect(settings)
+            self._key = settings
+        try:
+            self._conn.send_message(message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # The server dropped an idle connection; reconnect once before giving up.
+            self.close()
+            self._conn = self._connect(settings)
+            self._key = settings
+            self._conn.send_message(message)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._conn = None
+
+
+def build_email(config, messages):
+    if len(messages) == 1:
+        subject, body = "GeoFence Alert", messages[0]
+    else:
+        subject = f"GeoFence Alert ({len(messages)} events)"
+        body = '\n'.join(messages)
+    m = MIMEText(body)
+    m['Subject'] = subject; m['From'] = config.get('from'); m['To'] = config.get('to')
+    return m
+
+
+class AlertDispatcher:
+    """Queues alerts off the scan path and delivers them from worker threads.
+
+    A collector thread gathers alerts arriving within `digest_window` seconds into one batch,
+    so a burst becomes a single digest email. Each worker keeps its own SMTPSession, and a
+    failed delivery is retried up to `max_attempts` times with exponential backoff.
+    """
+
+    def __init__(self, load_config, workers=1, digest_window=DIGEST_WINDOW, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=RETRY_DELAY, session_factory=SMTPSession):
+        self.load_config = load_config
+        self.workers = workers
+        self.digest_window = digest_window
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.session_factory = session_factory
+        self.dropped = 0
+        self.failed = 0
+        self.delivered = 0
+        self.listeners = []  # called as listener(method, waits, seconds, ok) on a worker thread
+        self._pending = queue.Queue(MAX_PENDING)
+        self._batches = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads.append(threading.Thread(target=self._collect, name='alert-collector', daemon=True))
+            for i in range(self.workers):
+                self._threads.append(threading.Thread(target=self._work, name=f'alert-worker-{i}', daemon=True))
+            for t in self._threads:
+                t.start()
+
+    def submit(self, message):
+        self.start()
+        try:
+            self._pending.put_nowait((time.time(), message))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def pending(self):
+        return self._pending.qsize() + self._batches.qsize()
+
+    def wait_idle(self, timeout=None):
+        # Block until everything submitted so far has been delivered or given up on.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for q in (self._pending, self._batches):
+            with q.all_tasks_done:
+                while q.unfinished_tasks:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    q.all_tasks_done.wait(remaining)
+        return True
+
+    def _collect(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.digest_window
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._batches.put(batch)
+            for _ in batch:
+                self._pending.task_done()
+
+    def _work(self):
+        session = self.session_factory()
+        while True:
+            batch = self._batches.get()
+            try:
+                started = time.time()
+                method, ok = self._deliver(session, [message for _, message in batch])
+                finished = time.time()
+                # Waits run from submit() to delivery, so they include the digest window and retries.
+                for listener in self.listeners:
+                    try:
+                        listener(method, [finished - submitted for submitted, _ in batch], finished - started, ok)
+                    except Exception as e:
+                        print("Alert listener failed:", e)
+            finally:
+                self._batches.task_done()
+
+    def _deliver(self, session, messages):
+        config = self.load_config()
+        method = config.get('method', 'none')
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if method == 'audio':
+                    subprocess.run(['aplay', AUDIO_FILE], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                elif method == 'email':
+                    email = config.get('email', {})
+                    session.send(email, build_email(email, messages))
+                with self._lock:
+                    self.delivered += len(messages)
+                return method, True
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    with self._lock:
+                        self.failed += len(messages)
+                    print(f"Alert delivery failed after {attempt} attempts:", e)
+                    return method, False
+                time.sleep(delay)
+                delay *= 2
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """A local SMTP stand-in that accepts every message and keeps it in `messages`.
+
+    Speaks just enough plain SMTP (no TLS, no AUTH) for smtplib: point an `email` config at
+    it with smtp_ssl false, smtp_port set to `port` and no password. Runs on its own thread
+    after start(); stop() shuts it down.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.port = self.server_address[1]
+        self.messages = []
+        self.received = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def wait_for(self, count, timeout=None):
+        with self.received:
+            return self.received.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def deliver(self, sender, recipients, data):
+        with self.received:
+            self.messages.append({'from': sender, 'to': recipients, 'message': email.message_from_bytes(data)})
+            self.received.notify_all()
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 smtp-sink ready')
+        sender, recipients = None, []
+        for raw in self.rfile:
+            command = raw.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for line in self.rfile:
+                    if line in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(line[1:] if line.startswith(b'..') else line)
+                self.server.deliver(sender, recipients, b''.join(lines))
+                self.reply('250 OK queued')
+            elif verb in ('NOOP', 'RSET'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a local SMTP sink that prints every alert email it receives')
+    parser.add_argument('--port', type=int, default=1025)
+    args = parser.parse_args()
+    sink = SMTPSink(port=args.port).start()
+    print(f"SMTP sink listening on 127.0.0.1:{sink.port}")
+    seen = 0
+    while True:
+        sink.wait_for(seen + 1)
+        for m in sink.messages[seen:]:
+            print(f"--- {m['message']['Subject']} -> {', '.join(m['to'])}\n{m['message'].get_payload()}")
+        seen = len(sink.messages)
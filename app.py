@@ -1,13 +1,37 @@
-from flask import Flask, jsonify, request, render_template_string, session, redirect, url_for
-import subprocess
-import json
+from flask import Flask, Response, g, jsonify, request, render_template_string, session, redirect, url_for
+import atexit
+import math
 import os
+import copy
+import hmac
+import threading
+import time
+import zlib
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-import ipaddress
-import smtplib
-from email.mime.text import MIMEText
 from functools import wraps
-import requests
+from scan_engine import ScanEngine, SCAN_INTERVAL
+from event_stream import EventBroker
+from scan_diff import ScanDiffer
+from alert_dispatch import AlertDispatcher
+from presence import PresenceTracker
+from neighbor_table import scan_neighbors
+from subnet_sweep import PROBERS, SubnetSweeper
+from sensor_ingest import MAX_BATCH_BYTES, SensorMerger, decode_batch
+from device_registry import DeviceRegistry
+from zone_index import IPZoneIndex
+from gps_index import GPSZoneIndex
+from zone_geometry import GeometryCache, ZoneGeometry
+from config_cache import FileCache
+from gazetteer import GazetteerFile
+from geocoder import Geocoder, GeocodeError, GeocoderBusy, NominatimUpstream
+from resource_cache import VersionedResource, keyed_by
+from metrics import CONTENT_TYPE, MetricsRegistry
+import profiling
+from marker_index import marker_position, valid_update
+from log_index import query_time
+from storage import JSONStore
+from sqlite_store import SQLiteStore
 
 app = Flask(__name__)
 app.secret_key = 'supersecretkey'
@@ -19,6 +43,77 @@ ZONES_FILE = 'zones.json'
 LAST_SEEN_FILE = 'last_seen.json'
 ALERT_CONFIG_FILE = 'alert_config.json'
 MARKERS_FILE = 'markers.json'
+LAST_LOCATION_FILE = 'last_location.json'
+LOG_PAGE_SIZE = 100
+MAX_LOG_PAGE_SIZE = 1000
+MARKER_PAGE_SIZE = 1000
+MAX_MARKER_PAGE_SIZE = 10000
+DB_FILE = os.environ.get('GEOFENCE_DB', 'geofence.db')
+GEOCODE_CACHE_FILE = 'geocode_cache.db'
+
+# Nominatim-compatible search server used by /geocode; empty disables online lookups
+GEOCODER_URL = os.environ.get('GEOFENCE_GEOCODER_URL', 'https://nominatim.openstreetmap.org')
+
+# Optional CSV/TSV place extract searched offline before falling back to GEOCODER_URL
+GAZETTEER_FILE = os.environ.get('GEOFENCE_GAZETTEER')
+
+# State backend: 'json' (default, one file per kind of state) or 'sqlite' (DB_FILE, WAL mode)
+STORAGE_BACKEND = os.environ.get('GEOFENCE_STORAGE', 'json')
+
+# Neighbor table backend: 'auto', 'netlink', 'proc' or 'arp'
+NEIGHBOR_BACKEND = os.environ.get('GEOFENCE_NEIGHBOR_BACKEND', 'auto')
+
+# Active discovery of quiet hosts in ip_range zones: 'off', 'udp' (ARP nudge) or 'tcp' (connect probe)
+SWEEP_MODE = os.environ.get('GEOFENCE_SWEEP', 'off')
+SWEEP_INTERVAL = 300  # seconds
+
+# Shared secret for remote sensor agents (device_scanner.py --agent); unset disables /ingest
+SENSOR_TOKEN = os.environ.get('GEOFENCE_SENSOR_TOKEN')
+
+# Bearer token for Prometheus scrapes of /metrics; a logged-in session works without it
+METRICS_TOKEN = os.environ.get('GEOFENCE_METRICS_TOKEN')
+
+# Per-request phase timing in a Server-Timing response header ('on' to enable)
+REQUEST_TIMING = os.environ.get('GEOFENCE_REQUEST_TIMING', 'off') in ('on', '1', 'true')
+
+config_cache = FileCache()
+
+def json_store():
+    return JSONStore(config_cache, known_devices_file=KNOWN_DEVICES_FILE, zones_file=ZONES_FILE,
+                     last_seen_file=LAST_SEEN_FILE, last_location_file=LAST_LOCATION_FILE, markers_file=MARKERS_FILE,
+                     log_file=LOG_FILE)
+
+store = SQLiteStore(DB_FILE) if STORAGE_BACKEND == 'sqlite' else json_store()
+# last_seen refreshes are written every few minutes; write the latest ones on the way out.
+atexit.register(lambda: store.save_scan(store.last_seen(), flush=True))
+
+# Metrics, rendered in the Prometheus text format on /metrics
+metrics = MetricsRegistry('geofence_')
+scan_seconds = metrics.histogram('scan_duration_seconds', 'Time spent in each phase of a device scan.', ['phase'])
+scan_failures = metrics.counter('scan_failures_total', 'Neighbor table reads that failed.')
+scan_devices = metrics.gauge('scan_devices', 'Devices in the latest scan.', ['status', 'inside'])
+persist_seconds = metrics.histogram('persist_duration_seconds', 'Time to write state to disk.', ['target'])
+alerts_submitted = metrics.counter('alerts_submitted_total', 'Alerts queued for delivery.')
+alert_wait = metrics.histogram('alert_wait_seconds', 'Time from queueing an alert to its delivery.',
+                               buckets=(0.5, 1, 2, 2.5, 3, 5, 10, 30, 60, 120))
+alert_send = metrics.histogram('alert_send_duration_seconds', 'Time to deliver one batch of alerts.', ['method', 'result'])
+http_seconds = metrics.histogram('http_request_duration_seconds', 'Time to handle a request.', ['method', 'route'])
+http_requests = metrics.counter('http_requests_total', 'Requests handled.', ['method', 'route', 'status'])
+
+@contextmanager
+def scan_phase(name):
+    # Feeds the scan latency histogram and, when one is active, the thread's trace.
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        scan_seconds.labels(name).observe(elapsed)
+        profiling.record(name, elapsed)
+
+def request_span(name):
+    trace = profiling.current()
+    return trace.span(name) if trace is not None else nullcontext()
 
 # Admin credentials
 ADMIN_USERNAME = 'admin'
@@ -52,18 +147,42 @@ dashboard_template = """
         .alert { background-color: #ffeb3b; }
     </style>
     <script>
+        const HEADER = '<tr><th>IP</th><th>MAC</th><th>Status</th><th>Zone</th><th>Inside</th><th>Action</th></tr>';
+
+        function deviceRow(dev) {
+            let buttonLabel = dev.status === 'unknown' ? 'Trust' : 'Untrust';
+            return `<tr id="dev-${dev.mac}" class="${dev.status === 'unknown' ? 'unknown' : ''} ${!dev.inside ? 'alert' : ''}">` +
+                `<td>${dev.ip}</td><td>${dev.mac}</td><td>${dev.status}</td><td>${dev.zone}</td><td>${dev.inside}</td>` +
+                `<td><button onclick="toggleTrust('${dev.mac}', '${dev.status}')">${buttonLabel}</button></td></tr>`;
+        }
+
+        function renderDevices(devices) {
+            document.getElementById('deviceTable').innerHTML = HEADER + devices.map(deviceRow).join('');
+        }
+
+        function applyChange(change) {
+            // Only the affected row is touched; the rest of the table stays as it is.
+            const row = document.getElementById('dev-' + change.mac);
+            if (change.change === 'vanished') {
+                if (row) row.remove();
+            } else if (row) {
+                row.outerHTML = deviceRow(change.device);
+            } else {
+                document.getElementById('deviceTable').insertAdjacentHTML('beforeend', deviceRow(change.device));
+            }
+        }
+
         async function fetchDevices() {
             const res = await fetch('/devices');
             const data = await res.json();
-            const table = document.getElementById('deviceTable');
-            table.innerHTML = '<tr><th>IP</th><th>MAC</th><th>Status</th><th>Zone</th><th>Inside</th><th>Action</th></tr>';
-            data.devices.forEach(dev => {
-                let buttonLabel = dev.status === 'unknown' ? 'Trust' : 'Untrust';
-                let row = `<tr class="${dev.status === 'unknown' ? 'unknown' : ''} ${!dev.inside ? 'alert' : ''}">` +
-                    `<td>${dev.ip}</td><td>${dev.mac}</td><td>${dev.status}</td><td>${dev.zone}</td><td>${dev.inside}</td>` +
-                    `<td><button onclick="toggleTrust('${dev.mac}', '${dev.status}')">${buttonLabel}</button></td></tr>`;
-                table.innerHTML += row;
-            });
+            renderDevices(data.devices);
+        }
+
+        function subscribe() {
+            // The browser reconnects on its own and resumes from the last event it saw.
+            const source = new EventSource('/events');
+            source.addEventListener('snapshot', e => renderDevices(JSON.parse(e.data).devices));
+            source.addEventListener('device', e => applyChange(JSON.parse(e.data)));
         }
 
         async function toggleTrust(mac, status) {
@@ -73,7 +192,7 @@ dashboard_template = """
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ mac: mac })
             });
-            fetchDevices();
+            if (!window.EventSource) fetchDevices();
         }
 
         async function setAlertMethod(method) {
@@ -85,8 +204,12 @@ dashboard_template = """
         }
 
         window.onload = () => {
-            fetchDevices();
-            setInterval(fetchDevices, 10000);
+            if (window.EventSource) {
+                subscribe();
+            } else {
+                fetchDevices();
+                setInterval(fetchDevices, 10000);
+            }
         }
     </script>
 </head>
@@ -154,16 +277,21 @@ map.on('draw:created', function (e) {
     }
 });
 
-// Load zones
-fetch('/zones').then(res => res.json()).then(data => {
-    Object.entries(data).forEach(([name, zone]) => {
-        if (zone.type === 'gps' && zone.coords.length > 2) {
-            const poly = L.polygon(zone.coords.map(c => [c.lat, c.lon]), { color: 'blue' }).addTo(map);
-            poly.bindPopup(name);
-            drawnItems.addLayer(poly);
-        }
+// Load zones, simplified to about half a pixel at the current zoom
+const zoneLayer = L.layerGroup().addTo(map);
+
+function loadZones() {
+    const tolerance = 180 / (256 * Math.pow(2, map.getZoom()));
+    fetch(`/zones/geometry?tolerance=${tolerance}`).then(res => res.json()).then(data => {
+        zoneLayer.clearLayers();
+        Object.entries(data).forEach(([name, zone]) => {
+            L.polygon(zone.ring, { color: 'blue' }).bindPopup(name).addTo(zoneLayer);
+        });
     });
-});
+}
+
+map.on('zoomend', loadZones);
+loadZones();
 
 // Geocode address input
 function geocodeAddress() {
@@ -183,28 +311,50 @@ function geocodeAddress() {
         });
 }
 
+// Markers: only those in the current viewport are fetched
+const markerLayer = L.layerGroup().addTo(map);
+let markerRequest = 0;
+
+function addMarker(m) {
+    L.marker([m.lat, m.lon], { draggable: true }).bindPopup(m.label)
+        .on('dragend', e => {
+            const pos = e.target.getLatLng();
+            fetch('/markers/update', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ id: m.id, lat: pos.lat, lon: pos.lng })
+            });
+        })
+        .addTo(markerLayer);
+}
+
+function loadMarkers() {
+    const request = ++markerRequest;
+    fetch(`/markers?bbox=${map.getBounds().toBBoxString()}&limit=2000`)
+        .then(res => res.json())
+        .then(data => {
+            if (request !== markerRequest) return;  // the map moved again meanwhile
+            markerLayer.clearLayers();
+            data.markers.forEach(addMarker);
+        });
+}
+
+map.on('moveend', loadMarkers);
+loadMarkers();
+
 // Click to add marker
 map.on('click', function(e) {
     const label = prompt("Enter marker label:");
     if (label) {
-        const lat = e.latlng.lat;
-        const lon = e.latlng.lng;
-        L.marker([lat, lon]).bindPopup(label).addTo(map);
+        const marker = { lat: e.latlng.lat, lon: e.latlng.lng, label };
         fetch('/markers', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ lat, lon, label })
-        });
+            body: JSON.stringify(marker)
+        }).then(res => res.json()).then(saved => addMarker({ ...marker, id: saved.id }));
     }
 });
 
-// Load markers
-fetch('/markers').then(res => res.json()).then(markers => {
-    markers.forEach(m => {
-        L.marker([m.lat, m.lon]).bindPopup(m.label).addTo(map);
-    });
-});
-
 // Clear all markers
 function clearMarkers() {
     if (confirm("Are you sure you want to remove all markers?")) {
@@ -229,61 +379,77 @@ def login_required(f):
     return decorated
 
 def load_json_file(path):
-    if not os.path.exists(path):
-        return {}
-    try:
-        with open(path, 'r') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        print(f"Warning: {path} is empty or corrupted. Returning empty dict.")
-        return {}
+    # A private copy the caller may modify; read-only paths should use cached_json().
+    return copy.deepcopy(config_cache.load(path))
 
+def cached_json(path):
+    return config_cache.load(path)
 
 def save_json_file(path, data):
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=2)
+    with persist_seconds.labels(os.path.basename(path)).time():
+        config_cache.store(path, data)
+
+# Polled resources: ETag/If-None-Match and ?since=<version> deltas
+device_resource = VersionedResource('devices', keyed_by('mac'))
+zone_resource = VersionedResource('zones')
+marker_resource = VersionedResource('markers', keyed_by('id'))
+whitelist_resource = VersionedResource('whitelist')
+
+def versioned_response(resource, data, build=None, body_key=None):
+    resource.refresh(data)
+    if 'since' in request.args:
+        try:
+            since = int(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'Invalid version'}), 400
+        response = jsonify(resource.changes_since(since))
+    else:
+        response = Response(resource.body(build or (lambda: data), body_key), mimetype='application/json')
+    response.set_etag(resource.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 def scan_network():
     try:
-        output = subprocess.check_output(['arp', '-a']).decode()
-    except:
-        return []
-    result = []
-    for line in output.splitlines():
-        parts = line.split()
-        if len(parts) >= 4:
-            result.append({'ip': parts[1].strip('()'), 'mac': parts[3]})
-    return result
-
-def ip_in_range(ip, start, end):
-    try:
-        return ipaddress.IPv4Address(start) <= ipaddress.IPv4Address(ip) <= ipaddress.IPv4Address(end)
-    except:
-        return False
-
-def get_zone(ip, zones):
-    for name, z in zones.items():
-        if z['type'] == 'ip_range' and ip_in_range(ip, z['start'], z['end']):
-            return name, True
-    return 'none', False
-
-def play_audio(): os.system('aplay alert.wav')
-
-def send_email(subject, msg):
-    config = load_json_file(ALERT_CONFIG_FILE).get('email', {})
-    m = MIMEText(msg)
-    m['Subject'] = subject; m['From'] = config.get('from'); m['To'] = config.get('to')
-    try:
-        with smtplib.SMTP_SSL(config.get('smtp_server', 'smtp.gmail.com'), 465) as s:
-            s.login(config.get('from'), config.get('password'))
-            s.send_message(m)
+        with scan_phase('neighbors'):
+            return scan_neighbors(NEIGHBOR_BACKEND)
     except Exception as e:
-        print("Email failed:", e)
+        print("Scan failed:", e)
+        scan_failures.inc()
+        return []
+
+zone_geometry_cache = GeometryCache()
+
+def build_zone_indexes(zones):
+    # GPS zones are parsed once into ZoneGeometry; unchanged zones keep theirs across saves.
+    geometry = zone_geometry_cache.build(zones)
+    return {'ip': IPZoneIndex(zones), 'gps': GPSZoneIndex.from_polygons(geometry.polygons()), 'geometry': geometry}
+
+def load_zone_indexes():
+    return store.derive_zones('zone_indexes', build_zone_indexes)
+
+def load_zone_index():
+    return load_zone_indexes()['ip']
+
+def load_gps_index():
+    return load_zone_indexes()['gps']
+
+def load_zone_geometry():
+    return load_zone_indexes()['geometry']
+
+alert_dispatcher = AlertDispatcher(lambda: cached_json(ALERT_CONFIG_FILE))
 
 def alert_user(message):
-    method = load_json_file(ALERT_CONFIG_FILE).get('method', 'none')
-    if method == 'audio': play_audio()
-    elif method == 'email': send_email("GeoFence Alert", message)
+    # Delivery (audio, email) happens on the dispatcher's threads, never on the scan path.
+    alerts_submitted.inc()
+    alert_dispatcher.submit(message)
+
+def observe_alerts(method, waits, seconds, ok):
+    for waited in waits:
+        alert_wait.observe(waited)
+    alert_send.labels(method, 'ok' if ok else 'failed').observe(seconds)
+
+alert_dispatcher.listeners.append(observe_alerts)
 
 # Routes
 @app.route('/login', methods=['GET', 'POST'])
@@ -307,35 +473,234 @@ def logout():
 def dashboard():
     return render_template_string(dashboard_template)
 
+presence = PresenceTracker()
+sensor_merger = SensorMerger()
+registry = DeviceRegistry()
+
+def run_scan():
+    with scan_phase('total'):
+        known = store.trusted_macs()
+        index = load_zone_index()
+        # Remote sensors' sightings join the local scan; a device seen by several counts once.
+        raw = sensor_merger.merge(scan_network())
+        observations = {}
+        final = []
+        with scan_phase('zones'):
+            for d in raw:
+                mac = d['mac']
+                status = 'known' if mac in known else 'unknown'
+                matches = index.lookup(d['ip'])
+                zone, inside = (matches[0], True) if matches else ('none', False)
+                observations[mac] = {'ip': d['ip'], 'zone': zone, 'inside': inside}
+                final.append({**d, 'status': status, 'zone': zone, 'zones': list(matches), 'inside': inside})
+        with scan_phase('presence'):
+            config = cached_json(ALERT_CONFIG_FILE).get('presence')
+            updated, transitions = presence.observe(store.last_seen(), observations, config,
+                                                    alertable=lambda mac: mac not in known)
+        events = []
+        with scan_phase('alert'):
+            for t in transitions:
+                # Trusted devices' transitions are logged too; alertable() keeps them from alerting.
+                verb = {'entry': 'entered', 'exit': 'exited', 'vanished': 'vanished from'}[t['event']]
+                if t['alert']:
+                    alert_user(f"Unknown device {t['mac']} ({t['ip']}) {verb} zone {t['zone']}")
+                status = 'known' if t['mac'] in known else 'unknown'
+                events.append({'timestamp': datetime.now().isoformat(), 'ip': t['ip'], 'mac': t['mac'], 'status': status,
+                               'zone': t['zone'], 'inside': t['inside'], 'event': t['event'], 'alerted': t['alert']})
+        with scan_phase('persist'):
+            store.save_scan(updated, events)
+        registry.observe_scan(final, datetime.now().timestamp(), known)
+    counts = {}
+    for d in final:
+        key = (d['status'], 'true' if d['inside'] else 'false')
+        counts[key] = counts.get(key, 0) + 1
+    for status in ('known', 'unknown'):
+        for inside in ('true', 'false'):
+            scan_devices.labels(status, inside).set(counts.get((status, inside), 0))
+    return final
+
+scan_engine = ScanEngine(run_scan, interval=SCAN_INTERVAL)
+event_broker = EventBroker()
+scan_differ = ScanDiffer()
+
+def publish_changes(changes):
+    for c in changes:
+        event_broker.publish('device', {'change': c['type'], **{k: v for k, v in c.items() if k != 'type'}})
+
+# Only the UI gets raw changes; the event log is written from run_scan's debounced presence transitions.
+scan_differ.subscribe(publish_changes)
+
+def publish_snapshot(previous, devices):
+    event_broker.set_snapshot(scan_engine.snapshot())
+
+scan_engine.listeners.extend([scan_differ, publish_snapshot])
+
+sweep_engine = None
+if SWEEP_MODE in PROBERS:
+    # Each sweep fills the kernel neighbor table; the scan right after picks the new hosts up.
+    sweep_engine = ScanEngine(SubnetSweeper(store.zones, PROBERS[SWEEP_MODE]()), interval=SWEEP_INTERVAL)
+    sweep_engine.listeners.append(lambda previous, result: scan_engine.trigger())
+
+def start_scanning():
+    scan_engine.start()
+    if sweep_engine is not None:
+        sweep_engine.start()
+
+metrics.callback('scans_total', 'Device scans completed.', 'counter', lambda: scan_engine.snapshot()['scan_count'])
+metrics.callback('alerts_total', 'Alerts by delivery outcome.', 'counter', lambda: {
+    ('delivered',): alert_dispatcher.delivered, ('failed',): alert_dispatcher.failed,
+    ('dropped',): alert_dispatcher.dropped}, ['result'])
+metrics.callback('alert_queue_depth', 'Alerts waiting for delivery.', 'gauge', alert_dispatcher.pending)
+metrics.callback('event_subscribers', 'Open /events streams.', 'gauge', lambda: event_broker.subscribers)
+metrics.callback('registry_devices', 'Devices in the in-memory registry.', 'gauge', lambda: len(registry))
+metrics.callback('sensors', 'Remote sensors that have reported.', 'gauge', lambda: len(sensor_merger.sensors()))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Route patterns, not paths, keep the label set bounded.
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_seconds.labels(request.method, route).observe(time.perf_counter() - started)
+        http_requests.labels(request.method, route, response.status_code).inc()
+    return response
+
+@app.before_request
+def start_request_trace():
+    if REQUEST_TIMING:
+        profiling.activate(profiling.Trace())
+
+@app.after_request
+def add_server_timing(response):
+    trace = profiling.current()
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing([('total', trace.elapsed(), None)])
+    return response
+
+@app.teardown_request
+def end_request_trace(exc):
+    profiling.activate(None)
+
+_profile_lock = threading.Lock()
+
+@app.route('/admin/profile')
+@login_required
+def profile():
+    # Samples every thread of the running app for `seconds`; one profile at a time.
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args.get('interval_ms', profiling.SAMPLE_INTERVAL * 1000))
+    except ValueError:
+        return jsonify({'error': 'Invalid seconds or interval_ms'}), 400
+    # float() accepts nan and inf, which would slip past the range checks below.
+    if not (math.isfinite(seconds) and math.isfinite(interval_ms)) or seconds <= 0 or interval_ms <= 0:
+        return jsonify({'error': 'seconds and interval_ms must be positive numbers'}), 400
+    seconds = min(seconds, profiling.MAX_PROFILE_SECONDS)
+    interval = max(interval_ms, 1.0) / 1000
+    output = request.args.get('format', 'collapsed')
+    if output not in ('collapsed', 'speedscope'):
+        return jsonify({'error': 'format must be collapsed or speedscope'}), 400
+    if not _profile_lock.acquire(blocking=False):
+        return jsonify({'error': 'A profile is already running'}), 409
+    try:
+        profiler = profiling.SamplingProfiler(interval).run(seconds)
+    finally:
+        _profile_lock.release()
+    if output == 'speedscope':
+        response = Response(profiler.speedscope(), mimetype='application/json')
+        response.headers['Content-Disposition'] = 'attachment; filename="profile.speedscope.json"'
+    else:
+        response = Response(profiler.collapsed(), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(profiler.samples)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    token = request.headers.get('Authorization', '').encode()
+    if not session.get('user') and not (METRICS_TOKEN and hmac.compare_digest(token, f'Bearer {METRICS_TOKEN}'.encode())):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
 @app.route('/devices')
 @login_required
 def devices():
-    known = load_json_file(KNOWN_DEVICES_FILE)
-    zones = load_json_file(ZONES_FILE)
-    last = load_json_file(LAST_SEEN_FILE)
-    raw = scan_network()
-    updated = {}
-    final = []
-    for d in raw:
-        mac = d['mac']
-        status = 'known' if mac in known else 'unknown'
-        zone, inside = get_zone(d['ip'], zones)
-        prev = last.get(mac, {}).get('inside')
-        if status == 'unknown' and (prev is None or prev != inside):
-            alert_user(f"Unknown device {mac} ({d['ip']}) {'entered' if inside else 'exited'} zone {zone}")
-        updated[mac] = {'inside': inside}
-        final.append({**d, 'status': status, 'zone': zone, 'inside': inside})
-    save_json_file(LAST_SEEN_FILE, updated)
-    return jsonify({'devices': final})
+    start_scanning()
+    with request_span('wait'):
+        scan_engine.wait_ready(timeout=SCAN_INTERVAL)
+    snapshot, scan_trace = scan_engine.traced_snapshot()
+    trace = profiling.current()
+    if trace is not None and scan_trace is not None:
+        # Scans run on their own thread; report the phases of the one this response serves.
+        for name, seconds, _ in scan_trace.spans:
+            trace.add(f'scan-{name}', seconds, 'last scan')
+    # The ETag follows the device list; scanned_at alone changing does not invalidate it.
+    with request_span('encode'):
+        return versioned_response(device_resource, snapshot['devices'],
+                                  lambda: {**snapshot, 'version': device_resource.version},
+                                  (snapshot['scan_count'], device_resource.version))
+
+@app.route('/events')
+@login_required
+def stream_events():
+    # Server-Sent Events: a snapshot, then device deltas as scans find them.
+    start_scanning()
+    stream = event_broker.stream(request.headers.get('Last-Event-ID'))
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/ingest', methods=['POST'])
+def ingest():
+    # Batches from remote sensor agents; merged into the next device scan.
+    if not SENSOR_TOKEN:
+        return jsonify({'error': 'Ingestion disabled'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {SENSOR_TOKEN}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if (request.content_length or 0) > MAX_BATCH_BYTES:
+        return jsonify({'error': 'Batch too large'}), 413
+    # A chunked upload has no Content-Length, so stop reading one byte past the limit.
+    body = request.stream.read(MAX_BATCH_BYTES + 1)
+    if len(body) > MAX_BATCH_BYTES:
+        return jsonify({'error': 'Batch too large'}), 413
+    try:
+        doc = decode_batch(body, request.headers.get('Content-Encoding') == 'gzip')
+    except (ValueError, OSError, EOFError, zlib.error) as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+    return jsonify({'status': 'ok', 'accepted': sensor_merger.ingest(doc, request.remote_addr)})
+
+@app.route('/sensors')
+@login_required
+def sensors():
+    return jsonify(sensor_merger.sensors())
+
+@app.route('/registry')
+@login_required
+def registry_devices():
+    return jsonify({'devices': registry.devices(), 'count': len(registry)})
+
+@app.route('/registry/<mac>')
+@login_required
+def registry_device(mac):
+    try:
+        record = registry.get(mac)
+    except ValueError:
+        return jsonify({'error': 'Invalid MAC'}), 400
+    if record is None:
+        return jsonify({'error': 'Unknown device'}), 404
+    return jsonify(record)
 
 @app.route('/whitelist', methods=['GET', 'POST', 'DELETE'])
 @login_required
 def whitelist():
-    known = load_json_file(KNOWN_DEVICES_FILE)
-    if request.method == 'GET': return jsonify(known)
+    if request.method == 'GET': return versioned_response(whitelist_resource, store.known_devices())
     mac = request.json.get('mac')
-    if request.method == 'POST': known[mac] = 'Trusted'; save_json_file(KNOWN_DEVICES_FILE, known)
-    elif request.method == 'DELETE': known.pop(mac, None); save_json_file(KNOWN_DEVICES_FILE, known)
+    if request.method == 'POST': store.set_trusted(mac, 'Trusted')
+    elif request.method == 'DELETE': store.remove_trusted(mac)
+    if mac in registry: registry.set_trusted(mac, request.method == 'POST')
+    scan_engine.trigger()
     return jsonify({'status': 'ok'})
 
 @app.route('/alerts', methods=['POST'])
@@ -347,37 +712,74 @@ def alerts():
     save_json_file(ALERT_CONFIG_FILE, config)
     return jsonify({'status': 'updated'})
 
-@app.route('/markers', methods=['GET', 'POST', 'DELETE'])
+def parse_bbox(value):
+    # "west,south,east,north" (Leaflet's toBBoxString); longitudes may run past +/-180 on a wrapped map.
+    west, south, east, north = (float(v) for v in value.split(','))
+    if not south <= north:
+        raise ValueError('south > north')
+    south, north = max(south, -90.0), min(north, 90.0)
+    if east - west >= 360:
+        return south, -180.0, north, 180.0
+    wrap = lambda lon: (lon + 180.0) % 360.0 - 180.0
+    return south, wrap(west), north, wrap(east)
+
+def marker_batch(data):
+    # One marker, a list of them, or {"markers": [...]}.
+    if isinstance(data, dict) and isinstance(data.get('markers'), list):
+        return data['markers'], True
+    if isinstance(data, list):
+        return data, True
+    return [data], False
+
+@app.route('/markers', methods=['GET', 'POST', 'PATCH', 'DELETE'])
 def markers():
     if request.method == 'GET':
-        return jsonify(load_json_file(MARKERS_FILE))
+        if 'bbox' not in request.args:
+            return versioned_response(marker_resource, store.markers())
+        try:
+            bbox = parse_bbox(request.args['bbox'])
+            limit = max(1, min(int(request.args.get('limit', MARKER_PAGE_SIZE)), MAX_MARKER_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': 'Invalid bbox'}), 400
+        found, total = store.markers_in_bbox(*bbox, limit=limit)
+        return jsonify({'markers': found, 'total': total, 'truncated': total > len(found)})
     elif request.method == 'POST':
-        data = request.get_json()
-        markers = load_json_file(MARKERS_FILE)
-        markers.append(data)
-        save_json_file(MARKERS_FILE, markers)
-        return jsonify({'status': 'saved'})
+        batch, bulk = marker_batch(request.get_json(silent=True))
+        invalid = [i for i, m in enumerate(batch) if not isinstance(m, dict) or marker_position(m) is None]
+        if invalid:
+            return jsonify({'error': 'Invalid marker', 'invalid': invalid}), 400
+        ids = store.add_markers(batch)
+        return jsonify({'status': 'saved', 'ids': ids} if bulk else {'status': 'saved', 'id': ids[0]})
+    elif request.method == 'PATCH':
+        batch, _ = marker_batch(request.get_json(silent=True))
+        if not all(isinstance(m, dict) and 'id' in m for m in batch):
+            return jsonify({'error': 'Every update needs an id'}), 400
+        invalid = [i for i, m in enumerate(batch) if not valid_update(m)]
+        if invalid:
+            return jsonify({'error': 'Invalid marker position', 'invalid': invalid}), 400
+        updated = store.update_markers(batch)
+        missing = [str(m['id']) for m in batch if str(m['id']) not in updated]
+        return jsonify({'status': 'updated', 'updated': updated, 'missing': missing})
     elif request.method == 'DELETE':
-        save_json_file(MARKERS_FILE, [])
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and isinstance(data.get('ids'), list):
+            return jsonify({'status': 'deleted', 'deleted': store.delete_markers([str(i) for i in data['ids']])})
+        store.clear_markers()
         return jsonify({'status': 'cleared'})
-        
+
 @app.route('/markers/update', methods=['POST'])
 def update_marker():
     data = request.get_json()
+    if all(k in data for k in ('lat', 'lon')) and marker_position(data) is None:
+        return jsonify({'error': 'Invalid marker position'}), 400
+    if 'id' in data and all(k in data for k in ('lat', 'lon')):
+        if store.update_markers([{'id': str(data['id']), 'lat': data['lat'], 'lon': data['lon']}]):
+            return jsonify({'status': 'updated'})
+        return jsonify({'error': 'Marker not found'}), 404
     if not all(k in data for k in ('label', 'lat', 'lon')):
         return jsonify({'error': 'Invalid data'}), 400
 
-    markers = load_json_file(MARKERS_FILE)
-    updated = False
-    for m in markers:
-        if m.get('label') == data['label']:
-            m['lat'] = data['lat']
-            m['lon'] = data['lon']
-            updated = True
-            break
-
-    if updated:
-        save_json_file(MARKERS_FILE, markers)
+    if store.move_marker(data['label'], data['lat'], data['lon']):
         return jsonify({'status': 'updated'})
     else:
         return jsonify({'error': 'Marker not found'}), 404
@@ -386,13 +788,28 @@ def update_marker():
 @app.route('/logs')
 @login_required
 def logs():
-    if not os.path.exists(LOG_FILE): return jsonify([])
-    return jsonify([json.loads(line) for line in open(LOG_FILE) if line.strip()])
+    args = request.args
+    try:
+        since, until = (query_time(args[k]) if k in args else None for k in ('since', 'until'))
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO 8601 timestamps'}), 400
+    try:
+        limit = max(1, min(int(args.get('limit', LOG_PAGE_SIZE)), MAX_LOG_PAGE_SIZE))
+        if 'after' in args:
+            # Tail mode: everything appended since the last poll, in write order.
+            events, after = store.tail_events(args['after'], limit)
+            return jsonify({'events': events, 'after': after})
+        events, next_cursor = store.query_events(
+            since=since, until=until, mac=args.get('mac'), zone=args.get('zone'),
+            cursor=args.get('cursor'), limit=limit, descending=args.get('order', 'desc') != 'asc')
+    except ValueError:
+        return jsonify({'error': 'Invalid query'}), 400
+    return jsonify({'events': events, 'next_cursor': next_cursor})
 
 @app.route('/devices_by_mac')
 @login_required
 def device_manager():
-    return jsonify(load_json_file(KNOWN_DEVICES_FILE))
+    return jsonify(store.known_devices())
 
 @app.route('/gps')
 @login_required
@@ -403,11 +820,81 @@ def gps_page():
 @login_required
 def save_gps_zone():
     data = request.get_json()
-    zones = load_json_file(ZONES_FILE)
-    zones[data['name']] = { 'type': data.get('type', 'gps'), 'coords': data['coords'] }
-    save_json_file(ZONES_FILE, zones)
+    zone_type = data.get('type', 'gps')
+    if zone_type == 'gps':
+        try:
+            zone_geometry_cache.prime(data['name'], data['coords'], ZoneGeometry(data['name'], data.get('coords')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    store.save_zone(data['name'], { 'type': zone_type, 'coords': data['coords'] })
+    load_zone_indexes()  # derive geometry and indexes now rather than on the next scan
     return jsonify({'status': 'saved'})
 
+def parse_fix(fix, default_device):
+    try:
+        lat, lon = float(fix['lat']), float(fix['lon'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    ts = fix.get('timestamp')
+    try:
+        if ts is None:
+            when = datetime.now()
+        elif isinstance(ts, (int, float)):
+            when = datetime.fromtimestamp(ts / 1000 if ts > 1e11 else ts)
+        else:
+            when = datetime.fromisoformat(str(ts))
+    except (ValueError, OverflowError, OSError):
+        return None
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return {'device_id': str(fix.get('device_id') or default_device), 'lat': lat, 'lon': lon, 'timestamp': when}
+
+_location_lock = threading.Lock()
+
+@app.route('/report_location', methods=['POST'])
+@login_required
+def report_location():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'fixes' in data:
+        raw = data['fixes']
+    elif isinstance(data, dict):
+        raw = [data]
+    else:
+        raw = data
+    if not isinstance(raw, list):
+        return jsonify({'error': 'Invalid data'}), 400
+    default_device = (data.get('device_id') if isinstance(data, dict) else None) or request.remote_addr
+    fixes = [f for f in (parse_fix(r, default_device) for r in raw if isinstance(r, dict)) if f]
+    # Replay each device's fixes in time order so buffered uploads yield the right transitions.
+    fixes.sort(key=lambda f: (f['device_id'], f['timestamp']))
+    inside = load_gps_index().zones_at_many([f['lat'] for f in fixes], [f['lon'] for f in fixes])
+
+    transitions = []
+    with _location_lock:
+        state = store.locations()
+        changes = {}
+        for fix, zones in zip(fixes, inside):
+            device = fix['device_id']
+            when = fix['timestamp'].isoformat()
+            last = changes.get(device) or state.get(device, {})
+            if last.get('timestamp', '') > when:
+                continue  # older than what this device already reported
+            prev = set(last.get('zones', []))
+            current = set(zones)
+            for event, changed in (('entry', current - prev), ('exit', prev - current)):
+                for zone in sorted(changed):
+                    transitions.append({'timestamp': when, 'device_id': device, 'zone': zone,
+                                        'event': event, 'lat': fix['lat'], 'lon': fix['lon']})
+            changes[device] = {'zones': zones, 'lat': fix['lat'], 'lon': fix['lon'], 'timestamp': when}
+        store.save_locations(changes)
+    store.append_events([{**t, 'type': 'gps'} for t in transitions])
+    for t in transitions:
+        event_broker.publish('gps', t)
+        alert_user(f"Device {t['device_id']} {'entered' if t['event'] == 'entry' else 'exited'} GPS zone {t['zone']}")
+    return jsonify({'status': 'ok', 'accepted': len(fixes), 'rejected': len(raw) - len(fixes), 'transitions': transitions})
+
 @app.route('/map')
 @login_required
 def show_map():
@@ -416,7 +903,25 @@ def show_map():
 @app.route('/zones')
 @login_required
 def get_zones():
-    return jsonify(load_json_file(ZONES_FILE))
+    return versioned_response(zone_resource, store.zones())
+
+@app.route('/zones/geometry')
+@login_required
+def get_zone_geometry():
+    # Precomputed rings for the map, simplified to the coarsest level within `tolerance` degrees.
+    try:
+        tolerance = float(request.args.get('tolerance', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid tolerance'}), 400
+    zone_resource.refresh(store.zones())
+    level, body = load_zone_geometry().payload(tolerance)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(f'{zone_resource.etag}-{level}')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+geocoder = Geocoder(NominatimUpstream(GEOCODER_URL), cache_file=GEOCODE_CACHE_FILE) if GEOCODER_URL else None
+gazetteer = GazetteerFile(GAZETTEER_FILE) if GAZETTEER_FILE else None
 
 @app.route('/geocode')
 def geocode():
@@ -424,23 +929,24 @@ def geocode():
     if not query:
         return jsonify({'error': 'Missing query'}), 400
 
+    result = gazetteer.geocode(query) if gazetteer else None
     try:
-        r = requests.get(
-            'https://nominatim.openstreetmap.org/search',
-            params={"format": "json", "q": query},
-            headers={"User-Agent": "GeoFenceMe/1.0"}
-        )
-        data = r.json()
-        if r.ok and data:
-            return jsonify(data[0])
-        else:
-            return jsonify({'error': 'Address not found'}), 404
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        if result is None and geocoder:
+            result = geocoder.geocode(query)
+    except GeocoderBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(int(e.retry_after) + 1)}
+    except GeocodeError as e:
+        return jsonify({'error': str(e)}), 502
+    if result:
+        return jsonify(result)
+    return jsonify({'error': 'Address not found'}), 404
 
 
 
 
 if __name__ == '__main__':
+    # With the debug reloader only the child process should scan.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scanning()
     app.run(host='0.0.0.0', port=5000, debug=True)
 
@@ -0,0 +1,63 @@
+# Memory and update cost of the column-backed device registry against per-device dicts.
+# Run from the repo root: python -m benchmarks.bench_device_registry [--json out.json]
+import tracemalloc
+
+from device_registry import DeviceRegistry
+from benchmarks.harness import bench, parse_args, report
+
+ZONES = [(), ('lobby',), ('lab',), ('lab', 'floor-2'), ('warehouse',)]
+
+
+def synthetic_scan(n):
+    return [{'ip': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+             'mac': ':'.join(f'{b:02x}' for b in (0x02, 0, (i >> 24) & 255, (i >> 16) & 255, (i >> 8) & 255, i & 255)),
+             'zones': list(ZONES[i % len(ZONES)])} for i in range(n)]
+
+
+def dict_records(scan, now):
+    # What keeping the same fields per device in plain dicts costs (the last_seen.json shape).
+    return {d['mac']: {'first_seen': now, 'last_seen': now, 'ip': d['ip'], 'zones': list(d['zones']),
+                       'dwell': 0.0, 'entered': now, 'trusted': False, 'present': True} for d in scan}
+
+
+def measured(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, size
+
+
+def run(sizes):
+    results = []
+    for n in sizes:
+        scan = synthetic_scan(n)
+        registry, registry_bytes = measured(lambda: _filled(scan))
+        _, dict_bytes = measured(lambda: dict_records(scan, 1.0))
+        assert len(registry) == n
+        results.append({'name': 'registry.bytes_per_device', 'params': {'devices': n}, 'seconds': 0.0,
+                        'value': round(registry_bytes / n, 1), 'unit': 'B/device'})
+        results.append({'name': 'dict_records.bytes_per_device', 'params': {'devices': n}, 'seconds': 0.0,
+                        'value': round(dict_bytes / n, 1), 'unit': 'B/device'})
+        results.append({'name': 'registry.nbytes_per_device', 'params': {'devices': n}, 'seconds': 0.0,
+                        'value': round(registry.nbytes() / n, 1), 'unit': 'B/device'})
+        clock = iter(range(2, 1 << 30))
+        results.append(bench('registry.observe_scan', lambda: registry.observe_scan(scan, next(clock)), repeat=3, devices=n))
+        results.append(bench('registry.get', lambda: registry.get(scan[n // 2]['mac']), devices=n))
+    return results
+
+
+def _filled(scan):
+    registry = DeviceRegistry()
+    registry.observe_scan(scan, 1.0)
+    return registry
+
+
+def suite(quick=False):
+    return run([10000] if quick else [1000, 100000])
+
+
+if __name__ == '__main__':
+    args = parse_args('Device registry memory benchmark')
+    report('device_registry', suite(args.quick), args.json)
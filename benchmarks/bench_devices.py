@@ -0,0 +1,63 @@
+# End-to-end scan pipeline and /devices through Flask's test client, with a stubbed neighbor scan.
+# Run from the repo root: python -m benchmarks.bench_devices [--json out.json]
+import json
+import os
+import tempfile
+
+from benchmarks.bench_zone_index import synthetic_zones
+from benchmarks.harness import bench, parse_args, report
+
+
+def synthetic_scan(n):
+    return [{'ip': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}', 'iface': 'eth0',
+             'mac': ':'.join(f'{b:02x}' for b in (0x02, 0, (i >> 24) & 255, (i >> 16) & 255, (i >> 8) & 255, i & 255))}
+            for i in range(n)]
+
+
+def run(sizes, zones=100):
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # app keeps its state files in the working directory; give it a scratch one.
+        with open(os.path.join(tmp, 'zones.json'), 'w') as f:
+            json.dump(synthetic_zones(zones), f)
+        os.chdir(tmp)
+        try:
+            import app
+            engine = app.scan_engine
+            engine.interval = 3600  # only the scans below run
+            client = app.app.test_client()
+            with client.session_transaction() as s:
+                s['user'] = app.ADMIN_USERNAME
+            for n in sizes:
+                rows = synthetic_scan(n)
+                app.scan_network = lambda: rows
+                engine.scan_once()
+                engine.scan_once()  # settle first-sighting transitions
+                app.start_scanning()
+                first = client.get('/devices')
+                assert first.status_code == 200 and len(first.json['devices']) == n
+                etag = first.headers['ETag']
+
+                def scan_and_get():
+                    engine.scan_once()
+                    return client.get('/devices')
+
+                results.append(bench('devices.scan', engine.scan_once, repeat=3, devices=n, zones=zones))
+                results.append(bench('devices.get', lambda: client.get('/devices'), repeat=3, devices=n, zones=zones))
+                results.append(bench('devices.get_not_modified', lambda: client.get('/devices', headers={'If-None-Match': etag}),
+                                     devices=n, zones=zones))
+                results.append(bench('devices.scan_and_get', scan_and_get, repeat=3, devices=n, zones=zones))
+            engine.stop(timeout=1)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def suite(quick=False):
+    return run([100, 1000] if quick else [100, 1000, 10000])
+
+
+if __name__ == '__main__':
+    args = parse_args('End-to-end /devices benchmark')
+    report('devices', suite(args.quick), args.json)
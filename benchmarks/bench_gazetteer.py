@@ -0,0 +1,59 @@
+# Offline address lookup: inverted-index gazetteer queries (exact, prefix, fuzzy) vs a linear scan.
+# Run from the repo root: python -m benchmarks.bench_gazetteer [--json out.json]
+import random
+import string
+
+import gazetteer
+from benchmarks.harness import bench, parse_args, report
+
+STREET_TYPES = ['Street', 'Avenue', 'Road', 'Lane', 'Boulevard', 'Drive', 'Court', 'Place']
+CITIES = ['Springfield', 'Riverside', 'Fairview', 'Georgetown', 'Salem', 'Madison', 'Clinton', 'Franklin']
+
+
+def synthetic_places(n, seed=1):
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))).title()
+             for _ in range(max(50, n // 20))]
+    places = []
+    for k in range(n):
+        name = f'{rng.choice(words)} {rng.choice(STREET_TYPES)}'
+        city = rng.choice(CITIES)
+        places.append({'name': name, 'display_name': f'{name}, {city}', 'lat': rng.uniform(-60, 60),
+                       'lon': rng.uniform(-170, 170), 'type': 'street', 'importance': rng.random() / 10})
+    return places
+
+
+def linear_scan(places, query):
+    wanted = gazetteer.tokens(query)
+    return [p for p in places if all(t in gazetteer.tokens(p['display_name']) for t in wanted)][:1]
+
+
+def run(sizes):
+    results = []
+    for n in sizes:
+        places = synthetic_places(n)
+        index = gazetteer.Gazetteer(places)
+        target = places[n // 2]
+        exact = target['display_name']
+        prefix = exact[:-3]
+        word = target['name'].split()[0]
+        typo = f'{word[:2]}{word[3:]} {target["name"].split()[1]}'
+        assert index.geocode(exact)['display_name'].split(',')[0].split()[0] == word
+        assert index.geocode(typo) is not None
+        results.append(bench('gazetteer.build', lambda: gazetteer.Gazetteer(places), repeat=3, places=n))
+        results.append(bench('gazetteer.exact', lambda: index.geocode(exact), places=n))
+        results.append(bench('gazetteer.prefix', lambda: index.geocode(prefix), places=n))
+        index.geocode(typo)  # builds the fuzzy index outside the timing
+        results.append(bench('gazetteer.fuzzy', lambda: index.geocode(typo), places=n))
+        if n <= 10000:
+            results.append(bench('gazetteer.linear_scan', lambda: linear_scan(places, exact), repeat=3, places=n))
+    return results
+
+
+def suite(quick=False):
+    return run([1000] if quick else [1000, 10000, 100000])
+
+
+if __name__ == '__main__':
+    args = parse_args('Offline gazetteer benchmark')
+    report('gazetteer', suite(args.quick), args.json)
@@ -0,0 +1,61 @@
+# GPS zone containment: grid index + vectorized ray casting vs a linear scan.
+# Run from the repo root: python -m benchmarks.bench_gps_index [--json out.json]
+import math
+import random
+
+import gps_index
+from benchmarks.harness import bench, parse_args, report
+
+
+def synthetic_zones(n, vertices, seed=1):
+    rng = random.Random(seed)
+    zones = {}
+    for k in range(n):
+        lat, lon = rng.uniform(40.0, 41.0), rng.uniform(-74.5, -73.5)
+        radius = rng.uniform(0.002, 0.02)
+        coords = []
+        for v in range(vertices):
+            angle = 2 * math.pi * v / vertices
+            r = radius * rng.uniform(0.6, 1.0)
+            coords.append({'lat': lat + r * math.sin(angle), 'lon': lon + r * math.cos(angle)})
+        zones[f'zone{k}'] = {'type': 'gps', 'coords': coords}
+    return zones
+
+
+def random_points(n, seed=2):
+    rng = random.Random(seed)
+    return [rng.uniform(40.0, 41.0) for _ in range(n)], [rng.uniform(-74.5, -73.5) for _ in range(n)]
+
+
+def linear_scan(polygons, lat, lon):
+    return [p.name for p in polygons if gps_index.point_in_ring(lon, lat, p.xs, p.ys)]
+
+
+def run(zone_counts, vertices, batch):
+    results = []
+    lats, lons = random_points(batch)
+    for n in zone_counts:
+        for v in vertices:
+            zones = synthetic_zones(n, v)
+            index = gps_index.GPSZoneIndex(zones)
+            for lat, lon in zip(lats[:200], lons[:200]):
+                assert index.zones_at(lat, lon) == linear_scan(index.polygons, lat, lon)
+            many = index.zones_at_many(lats, lons)
+            assert many[:200] == [index.zones_at(a, b) for a, b in zip(lats[:200], lons[:200])]
+            lat, lon = lats[0], lons[0]
+            results.append(bench('gps.build_index', lambda: gps_index.GPSZoneIndex(zones), repeat=3, zones=n, vertices=v))
+            results.append(bench('gps.zones_at', lambda: index.zones_at(lat, lon), zones=n, vertices=v))
+            results.append(bench('gps.linear_scan', lambda: linear_scan(index.polygons, lat, lon), zones=n, vertices=v))
+            results.append(bench('gps.zones_at_many', lambda: index.zones_at_many(lats, lons), repeat=3, zones=n, vertices=v, points=batch))
+    return results
+
+
+def suite(quick=False):
+    if quick:
+        return run([100], [8, 64], 200)
+    return run([100, 1000, 5000], [8, 64, 256], 1000)
+
+
+if __name__ == '__main__':
+    args = parse_args('GPS zone containment benchmark')
+    report('gps_index', suite(args.quick), args.json)
@@ -0,0 +1,73 @@
+# Compares neighbor table parsers on synthetic tables.
+# Run from the repo root: python -m benchmarks.bench_neighbor_table [--json out.json]
+import socket
+import struct
+
+import neighbor_table as nt
+from benchmarks.harness import bench, parse_args, report
+
+
+def synthetic_neighbors(n):
+    for i in range(n):
+        ip = f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'
+        mac = ':'.join(f'{b:02x}' for b in (0x02, 0, (i >> 24) & 255, (i >> 16) & 255, (i >> 8) & 255, i & 255))
+        yield ip, mac
+
+
+def proc_arp_text(n):
+    lines = ['IP address       HW type     Flags       HW address            Mask     Device']
+    for ip, mac in synthetic_neighbors(n):
+        lines.append(f'{ip:<16} 0x1         0x2         {mac}     *        eth0')
+    return '\n'.join(lines) + '\n'
+
+
+def arp_command_text(n):
+    return ''.join(f'? ({ip}) at {mac} [ether] on eth0\n' for ip, mac in synthetic_neighbors(n))
+
+
+def netlink_dump(n):
+    parts = []
+    for ip, mac in synthetic_neighbors(n):
+        attrs = b''
+        for attr_type, payload in ((nt.NDA_DST, socket.inet_aton(ip)), (nt.NDA_LLADDR, bytes.fromhex(mac.replace(':', '')))):
+            attr = nt.RTATTR.pack(nt.RTATTR.size + len(payload), attr_type) + payload
+            attrs += attr + b'\0' * (-len(attr) % 4)
+        body = nt.NDMSG.pack(socket.AF_INET, 1, 0x02, 0, 1) + attrs
+        parts.append(nt.NLMSG_HDR.pack(nt.NLMSG_HDR.size + len(body), nt.RTM_NEWNEIGH, 2, 1, 0) + body)
+    parts.append(nt.NLMSG_HDR.pack(nt.NLMSG_HDR.size + 4, nt.NLMSG_DONE, 2, 1, 0) + struct.pack('=i', 0))
+    return b''.join(parts)
+
+
+def legacy_arp_parse(text):
+    # The original per-line split from app.py, kept for comparison.
+    result = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 4:
+            result.append({'ip': parts[1].strip('()'), 'mac': parts[3]})
+    return result
+
+
+def run(sizes):
+    results = []
+    ifnames = {1: 'eth0'}
+    for n in sizes:
+        proc = proc_arp_text(n)
+        arp = arp_command_text(n)
+        dump = netlink_dump(n)
+        assert len(nt.parse_proc_arp(proc)) == len(nt.parse_arp_output(arp)) == n
+        assert len(nt.parse_netlink_neighbors(dump, dict(ifnames))) == n
+        results.append(bench('neighbor.parse_netlink', lambda: nt.parse_netlink_neighbors(dump, dict(ifnames)), entries=n))
+        results.append(bench('neighbor.parse_proc_arp', lambda: nt.parse_proc_arp(proc), entries=n))
+        results.append(bench('neighbor.parse_arp_output', lambda: nt.parse_arp_output(arp), entries=n))
+        results.append(bench('neighbor.legacy_arp_split', lambda: legacy_arp_parse(arp), entries=n))
+    return results
+
+
+def suite(quick=False):
+    return run([1000] if quick else [100, 10000, 100000])
+
+
+if __name__ == '__main__':
+    args = parse_args('Neighbor table backend benchmark')
+    report('neighbor_table', suite(args.quick), args.json)
@@ -0,0 +1,95 @@
+# JSON state persistence at realistic sizes: whole-file writes, cached loads and journaled scans.
+# Run from the repo root: python -m benchmarks.bench_persistence [--json out.json]
+import copy
+import json
+import os
+import tempfile
+from itertools import count
+
+from config_cache import FileCache, write_json_atomic
+from journal import JournalMap
+from presence import StateWriteBehind
+from benchmarks.harness import bench, parse_args, report
+
+
+def last_seen_state(n, now=1700000000.0):
+    # The shape PresenceTracker keeps per MAC in last_seen.json.
+    return {':'.join(f'{b:02x}' for b in (0x02, 0, (i >> 24) & 255, (i >> 16) & 255, (i >> 8) & 255, i & 255)): {
+        'inside': i % 3 != 0, 'zone': f'zone{i % 50}', 'present': True, 'first_seen': now - i,
+        'last_seen': now, 'ip': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'} for i in range(n)}
+
+
+def legacy_save(path, data):
+    # The original save_json_file: rewrite the whole file in place.
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def run(sizes):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            state = last_seen_state(n)
+            path = os.path.join(tmp, f'state{n}.json')
+            write_json_atomic(path, state)
+            cache = FileCache()
+            assert cache.load(path) == state
+
+            def cold_load():
+                with open(path) as f:
+                    return json.load(f)
+
+            results.append(bench('persist.save_json_file', lambda: write_json_atomic(path, state), repeat=3, devices=n))
+            results.append(bench('persist.legacy_save', lambda: legacy_save(path, state), repeat=3, devices=n))
+            results.append(bench('persist.load_cold', cold_load, repeat=3, devices=n))
+            results.append(bench('persist.cached_json', lambda: cache.load(path), devices=n))
+            results.append(bench('persist.load_json_file', lambda: copy.deepcopy(cache.load(path)), repeat=3, devices=n))
+
+            # A scan as PresenceTracker produces it: every device's last_seen refreshed, 1% changing zone.
+            macs = list(state)
+            movers = macs[:max(1, n // 100)]
+            tick = count(1)
+
+            def next_scan(previous):
+                now = state[macs[0]]['last_seen'] + next(tick)
+                scan = {mac: {**entry, 'last_seen': now} for mac, entry in previous.items()}
+                for mac in movers:
+                    scan[mac]['zone'] = f'zone{now % 50:.0f}'
+                return scan
+
+            write_through = JournalMap(os.path.join(tmp, f'through{n}.json'))
+            write_through.replace(state)
+            write_behind = JournalMap(os.path.join(tmp, f'behind{n}.json'))
+            write_behind.replace(state)
+            buffer = StateWriteBehind()
+            scans = {'through': state, 'behind': state}
+
+            def scan_write_through():
+                scans['through'] = next_scan(scans['through'])
+                write_through.replace(scans['through'])
+
+            def scan_write_behind():
+                # What JSONStore.save_scan does between flushes.
+                scans['behind'] = next_scan(scans['behind'])
+                write_behind.update(*buffer.changes(write_behind.data(), scans['behind']))
+
+            results.append(bench('persist.journal_scan_write_through', scan_write_through, repeat=3, devices=n))
+            results.append(bench('persist.journal_scan_write_behind', scan_write_behind, repeat=3, devices=n))
+
+            # Journal bytes per scan, which is what the disk (often an SD card) actually sees.
+            for mode, write in (('through', scan_write_through), ('behind', scan_write_behind)):
+                journal = write_through if mode == 'through' else write_behind
+                journal.compact()
+                write()
+                results.append({'name': f'persist.journal_bytes_per_scan_{mode}', 'params': {'devices': n}, 'seconds': 0.0,
+                                'value': os.path.getsize(journal.journal_path), 'unit': 'bytes'})
+    return results
+
+
+def suite(quick=False):
+    return run([100, 1000] if quick else [100, 1000, 10000])
+
+
+if __name__ == '__main__':
+    args = parse_args('JSON persistence benchmark')
+    report('persistence', suite(args.quick), args.json)
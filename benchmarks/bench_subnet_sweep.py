@@ -0,0 +1,56 @@
+# Active subnet sweep against an in-process fake network, so it runs without touching a real LAN.
+# Run from the repo root: python -m benchmarks.bench_subnet_sweep [--json out.json]
+import asyncio
+import random
+import time
+
+from subnet_sweep import PROBE_TIMEOUT, SWEEP_CONCURRENCY, sweep, sweep_addresses
+from benchmarks.harness import parse_args, report
+
+
+class FakeNetwork:
+    """A prober whose live hosts answer after a few ms and whose empty addresses stay silent
+    until the probe timeout, like a real sweep of a sparsely populated subnet."""
+
+    def __init__(self, addresses, live=0.1, latency=0.005, timeout=PROBE_TIMEOUT, seed=3):
+        rng = random.Random(seed)
+        self.up = {a for a in addresses if rng.random() < live}
+        self.latency = latency
+        self.timeout = timeout
+        self.in_flight = 0
+        self.peak = 0
+
+    async def probe(self, address):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            if address in self.up:
+                await asyncio.sleep(self.latency)
+                return True
+            await asyncio.sleep(self.timeout)
+            return False
+        finally:
+            self.in_flight -= 1
+
+
+def run(prefixes, concurrency=SWEEP_CONCURRENCY):
+    results = []
+    for prefix in prefixes:
+        addresses = sweep_addresses({'lan': {'type': 'cidr', 'cidr': f'10.0.0.0/{prefix}'}})
+        network = FakeNetwork(addresses)
+        started = time.perf_counter()
+        found = sweep(addresses, network, concurrency)
+        seconds = time.perf_counter() - started
+        assert set(found) == network.up and network.peak <= concurrency
+        params = {'prefix': f'/{prefix}', 'hosts': len(addresses), 'concurrency': concurrency}
+        results.append({'name': 'sweep.fake_network', 'params': params, 'seconds': seconds, 'loops': 1, 'repeat': 1})
+    return results
+
+
+def suite(quick=False):
+    return run([24] if quick else [24, 22])
+
+
+if __name__ == '__main__':
+    args = parse_args('Subnet sweep benchmark')
+    report('subnet_sweep', suite(args.quick), args.json)
@@ -0,0 +1,70 @@
+# IP zone lookup: the sorted-segment IPZoneIndex vs the original per-zone get_zone() scan.
+# Run from the repo root: python -m benchmarks.bench_zone_index [--json out.json]
+import ipaddress
+import random
+
+from zone_index import IPZoneIndex
+from benchmarks.harness import bench, parse_args, report
+
+
+def synthetic_zones(n, seed=1):
+    # /24-sized ip_range zones across 10.0.0.0/8, some overlapping, plus a few CIDR blocks.
+    rng = random.Random(seed)
+    zones = {}
+    for k in range(n):
+        start = rng.randrange(0x0A000000, 0x0AFFFF00)
+        end = start + rng.randrange(16, 512)
+        zones[f'zone{k}'] = {'type': 'ip_range', 'start': str(ipaddress.IPv4Address(start)),
+                             'end': str(ipaddress.IPv4Address(end))}
+    for k in range(max(1, n // 100)):
+        zones[f'net{k}'] = {'type': 'cidr', 'cidr': f'10.{rng.randrange(256)}.0.0/16'}
+    return zones
+
+
+def random_ips(n, seed=2):
+    rng = random.Random(seed)
+    return [str(ipaddress.IPv4Address(rng.randrange(0x0A000000, 0x0B000000))) for _ in range(n)]
+
+
+def ip_in_range(ip, start, end):
+    try:
+        return ipaddress.IPv4Address(start) <= ipaddress.IPv4Address(ip) <= ipaddress.IPv4Address(end)
+    except ValueError:
+        return False
+
+
+def legacy_get_zone(ip, zones):
+    # The original app.py lookup, kept for comparison.
+    for name, z in zones.items():
+        if z['type'] == 'ip_range' and ip_in_range(ip, z['start'], z['end']):
+            return name, True
+    return 'none', False
+
+
+def run(zone_counts, batch):
+    results = []
+    ips = random_ips(batch)
+    for n in zone_counts:
+        zones = synthetic_zones(n)
+        index = IPZoneIndex(zones)
+        ip_only = {name: z for name, z in zones.items() if z['type'] == 'ip_range'}
+        ip_index = IPZoneIndex(ip_only)
+        for ip in ips[:50]:
+            matches = ip_index.lookup(ip)
+            assert (matches[0] if matches else 'none') == legacy_get_zone(ip, ip_only)[0]
+        ip = ips[0]
+        results.append(bench('zone.build_index', lambda: IPZoneIndex(zones), repeat=3, zones=n))
+        results.append(bench('zone.lookup', lambda: index.lookup(ip), zones=n))
+        results.append(bench('zone.lookup_batch', lambda: [index.lookup(a) for a in ips], repeat=3, zones=n, ips=batch))
+        if n <= 1000:
+            results.append(bench('zone.legacy_get_zone', lambda: legacy_get_zone(ip, ip_only), repeat=3, zones=n))
+    return results
+
+
+def suite(quick=False):
+    return run([10, 1000] if quick else [10, 1000, 10000], 1000)
+
+
+if __name__ == '__main__':
+    args = parse_args('IP zone lookup benchmark')
+    report('zone_index', suite(args.quick), args.json)
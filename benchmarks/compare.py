@@ -0,0 +1,54 @@
+# Compares two results files from the same benchmark and flags regressions.
+# Run from the repo root: python -m benchmarks.compare baseline.json current.json [--threshold 1.25]
+import argparse
+import json
+import sys
+
+
+def result_key(doc, r):
+    params = tuple(sorted((k, str(v)) for k, v in r['params'].items()))
+    return r.get('suite', doc.get('suite')), r['name'], params
+
+
+def measure(r):
+    # Time results compare seconds; value results (e.g. B/device) compare the value itself.
+    return r['seconds'] if r.get('value') is None else r['value']
+
+
+def compare(baseline, current, threshold):
+    before = {result_key(baseline, r): r for r in baseline['results']}
+    regressions = 0
+    for r in current['results']:
+        key = result_key(current, r)
+        old = before.get(key)
+        if old is None or not measure(old):
+            continue
+        ratio = measure(r) / measure(old)
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        params = ' '.join(f'{k}={v}' for k, v in key[2])
+        print(f"{key[0] or '':<16} {key[1]:<36} {params:<30} x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    print(f'{regressions} regression(s) beyond x{args.threshold}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import json
+import platform
+import sys
+import timeit
+from datetime import datetime
+
+
+def bench(name, fn, repeat=5, **params):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {'name': name, 'params': params, 'seconds': best, 'loops': number, 'repeat': repeat}
+
+
+def format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f} {unit}'
+    return f'{seconds / 1e-9:.0f} ns'
+
+
+def report(suite, results, json_path=None):
+    for r in results:
+        params = ' '.join(f'{k}={v}' for k, v in r['params'].items())
+        value = r.get('value')
+        shown = format_seconds(r['seconds']) if value is None else f"{value} {r.get('unit', '')}"
+        print(f"{r['name']:<40} {params:<30} {shown}")
+    if json_path:
+        write_results(suite, results, json_path)
+
+
+def write_results(suite, results, json_path):
+    doc = {
+        'suite': suite,
+        'created': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(json_path, 'w') as f:
+        json.dump(doc, f, indent=2)
+
+
+def parse_args(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--json', metavar='PATH', help='write machine-readable results to PATH')
+    parser.add_argument('--quick', action='store_true', help='use smaller sizes for a fast run')
+    return parser.parse_args()
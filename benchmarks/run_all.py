@@ -0,0 +1,33 @@
+# Runs every benchmark suite and writes one combined results file.
+# Run from the repo root: python -m benchmarks.run_all [--quick] [--only zone_index,devices] [--json out.json]
+import argparse
+import importlib
+
+from benchmarks.harness import report, write_results
+
+SUITES = ('neighbor_table', 'zone_index', 'gps_index', 'persistence', 'devices', 'device_registry', 'gazetteer', 'subnet_sweep')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all benchmark suites')
+    parser.add_argument('--json', metavar='PATH', help='write machine-readable results to PATH')
+    parser.add_argument('--quick', action='store_true', help='use smaller sizes for a fast run')
+    parser.add_argument('--only', metavar='SUITES', help=f"comma-separated subset of {', '.join(SUITES)}")
+    args = parser.parse_args()
+    names = args.only.split(',') if args.only else SUITES
+    unknown = set(names) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    results = []
+    for name in names:
+        print(f'== {name}')
+        module = importlib.import_module(f'benchmarks.bench_{name}')
+        suite_results = [{**r, 'suite': name} for r in module.suite(args.quick)]
+        report(name, suite_results)
+        results.extend(suite_results)
+    if args.json:
+        write_results('all', results, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def write_json_atomic(path, data):
+    # Write beside the target and rename over it, so a crash never leaves a half-written file.
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class FileCache:
+    """Parsed JSON files kept in memory and re-read only when their stat signature changes.
+
+    Objects handed out by load() and derive() are shared between callers and must be
+    treated as read-only; write changes back through store(), which takes ownership of
+    the object it is given.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _entry(self, path):
+        stamp = file_stamp(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry['stamp'] == stamp:
+                return entry
+            entry = {'stamp': stamp, 'data': self._read(path), 'derived': {}}
+            self._entries[path] = entry
+            return entry
+
+    @staticmethod
+    def _read(path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {path} is empty or corrupted. Returning empty dict.")
+            return {}
+
+    def load(self, path):
+        return self._entry(path)['data']
+
+    def derive(self, path, name, builder):
+        # Derived structures (indexes, sets) live and die with the parsed file they came from.
+        entry = self._entry(path)
+        derived = entry['derived']
+        if name not in derived:
+            derived[name] = builder(entry['data'])
+        return derived[name]
+
+    def store(self, path, data):
+        write_json_atomic(path, data)
+        with self._lock:
+            self._entries[path] = {'stamp': file_stamp(path), 'data': data, 'derived': {}}
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
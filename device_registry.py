@@ -0,0 +1,187 @@
+import sys
+import threading
+from array import array
+
+from zone_index import ip_to_int
+from neighbor_table import normalize_mac
+
+TRUSTED = 1
+PRESENT = 2
+NO_IP = 0xFFFFFFFF  # IPv4 column value for "not an IPv4 address"
+
+
+def mac_to_int(mac):
+    if len(mac) == 17 and mac[2] == ':' and mac[14] == ':':
+        return int(mac.replace(':', ''), 16)  # the normalized form scans produce
+    parts = normalize_mac(mac).split(':')
+    if len(parts) != 6 or any(len(p) != 2 for p in parts):
+        raise ValueError(f'invalid MAC {mac!r}')
+    return int(''.join(parts), 16)
+
+
+def int_to_mac(value):
+    raw = f'{value:012x}'
+    return ':'.join(raw[i:i + 2] for i in range(0, 12, 2))
+
+
+def int_to_ip(value):
+    return '.'.join(str((value >> shift) & 0xff) for shift in (24, 16, 8, 0))
+
+
+class DeviceRegistry:
+    """Column store of per-device state, compact enough for campus-scale device counts.
+
+    Each device is one row across typed arrays: the MAC as a 48-bit integer, first/last
+    seen, the last IPv4 address as an unsigned 32-bit int, an interned zone-set id, time
+    inside zones (dwell), when the current stay began, and trust/presence flags. A dict maps
+    MAC integers to rows; zone sets are few, so each distinct tuple of zone names is stored
+    once. Rows are never moved, so forgetting devices leaves holes until compact().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = {}  # mac int -> row
+        self.macs = array('Q')
+        self.first_seen = array('d')
+        self.last_seen = array('d')
+        self.ips = array('I')
+        self.zone_ids = array('I')
+        self.dwell = array('d')
+        self.entered = array('d')
+        self.flags = array('B')
+        self.zone_sets = [()]
+        self._zone_ids = {(): 0}
+        self._other_ips = {}  # row -> non-IPv4 address
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, mac):
+        try:
+            return mac_to_int(mac) in self.index
+        except (ValueError, TypeError, AttributeError):
+            return False
+
+    def _zone_id(self, zones):
+        zones = tuple(zones)
+        zid = self._zone_ids.get(zones)
+        if zid is None:
+            zid = self._zone_ids[zones] = len(self.zone_sets)
+            self.zone_sets.append(zones)
+        return zid
+
+    def _row(self, key, now):
+        row = self.index.get(key)
+        if row is None:
+            row = self.index[key] = len(self.macs)
+            self.macs.append(key)
+            self.first_seen.append(now)
+            self.last_seen.append(now)
+            self.ips.append(NO_IP)
+            self.zone_ids.append(0)
+            self.dwell.append(0.0)
+            self.entered.append(0.0)
+            self.flags.append(0)
+        return row
+
+    def _observe(self, key, ip, zones, now, trusted):
+        row = self._row(key, now)
+        ip_value = ip_to_int(ip)
+        if ip_value is None:
+            self._other_ips[row] = ip
+            ip_value = NO_IP
+        else:
+            self._other_ips.pop(row, None)
+        self.ips[row] = ip_value
+        zid = self._zone_id(zones)
+        previous = self.zone_ids[row]
+        if previous and self.flags[row] & PRESENT:
+            # Inside some zone since the last sighting: count the time in between.
+            self.dwell[row] += max(0.0, now - self.last_seen[row])
+        if zid != previous:
+            self.zone_ids[row] = zid
+            self.entered[row] = now if zid else 0.0
+        self.last_seen[row] = now
+        flags = self.flags[row] | PRESENT
+        if trusted is not None:
+            flags = flags | TRUSTED if trusted else flags & ~TRUSTED
+        self.flags[row] = flags
+
+    def observe(self, mac, ip, zones=(), now=0.0, trusted=None):
+        with self._lock:
+            self._observe(mac_to_int(mac), ip, zones, now, trusted)
+
+    def observe_scan(self, devices, now, trusted_macs=None, grace=0.0):
+        """Fold one scan (rows with mac, ip, zones) in; devices missing for `grace` seconds lose PRESENT."""
+        with self._lock:
+            seen = set()
+            for d in devices:
+                try:
+                    key = mac_to_int(d['mac'])
+                except (ValueError, TypeError, AttributeError):
+                    print(f"Warning: registry skipping invalid MAC {d['mac']!r}")
+                    continue
+                seen.add(key)
+                trusted = None if trusted_macs is None else d['mac'] in trusted_macs
+                self._observe(key, d['ip'], d.get('zones', ()), now, trusted)
+            flags, last_seen = self.flags, self.last_seen
+            for key, row in self.index.items():
+                if key not in seen and flags[row] & PRESENT and now - last_seen[row] > grace:
+                    flags[row] &= ~PRESENT
+
+    def set_trusted(self, mac, trusted=True):
+        with self._lock:
+            row = self.index.get(mac_to_int(mac))
+            if row is not None:
+                self.flags[row] = self.flags[row] | TRUSTED if trusted else self.flags[row] & ~TRUSTED
+
+    def forget(self, mac):
+        with self._lock:
+            row = self.index.pop(mac_to_int(mac), None)
+            if row is not None:
+                self._other_ips.pop(row, None)
+            return row is not None
+
+    def compact(self):
+        # Rebuild the columns without the rows of forgotten devices.
+        with self._lock:
+            rows = sorted(self.index.values())
+            for name in ('macs', 'first_seen', 'last_seen', 'ips', 'zone_ids', 'dwell', 'entered', 'flags'):
+                column = getattr(self, name)
+                setattr(self, name, array(column.typecode, (column[r] for r in rows)))
+            remap = {old: new for new, old in enumerate(rows)}
+            self.index = {key: remap[row] for key, row in self.index.items()}
+            self._other_ips = {remap[row]: ip for row, ip in self._other_ips.items() if row in remap}
+
+    def record(self, row):
+        ip = self.ips[row]
+        flags = self.flags[row]
+        return {
+            'mac': int_to_mac(self.macs[row]),
+            'ip': self._other_ips.get(row) if ip == NO_IP else int_to_ip(ip),
+            'zones': list(self.zone_sets[self.zone_ids[row]]),
+            'first_seen': self.first_seen[row],
+            'last_seen': self.last_seen[row],
+            'dwell': self.dwell[row],
+            'entered': self.entered[row] or None,
+            'trusted': bool(flags & TRUSTED),
+            'present': bool(flags & PRESENT),
+        }
+
+    def get(self, mac):
+        with self._lock:
+            row = self.index.get(mac_to_int(mac))
+            return None if row is None else self.record(row)
+
+    def devices(self):
+        with self._lock:
+            return [self.record(row) for row in sorted(self.index.values())]
+
+    def nbytes(self):
+        """Approximate memory held: column buffers, the MAC index and the interned zone sets."""
+        columns = sum(c.itemsize * c.buffer_info()[1] for c in
+                      (self.macs, self.first_seen, self.last_seen, self.ips, self.zone_ids, self.dwell,
+                       self.entered, self.flags))
+        index = sys.getsizeof(self.index) + sum(sys.getsizeof(k) for k in self.index)
+        zones = sys.getsizeof(self.zone_sets) + sum(sys.getsizeof(z) for z in self.zone_sets)
+        return columns + index + zones
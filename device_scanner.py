@@ -1,20 +1,28 @@
-import subprocess
+import argparse
+import socket
 import time
 import json
 import os
+import urllib.error
+import urllib.request
 from datetime import datetime
 
+from journal import JournalMap
+from neighbor_table import scan_neighbors
+from sensor_ingest import encode_batch
+
 # Path to known devices file
 KNOWN_DEVICES_FILE = 'known_devices.json'
 LOG_FILE = 'device_log.txt'
 SCAN_INTERVAL = 10  # seconds
+NEIGHBOR_BACKEND = os.environ.get('GEOFENCE_NEIGHBOR_BACKEND', 'auto')
+PUSH_INTERVAL = 30  # seconds between batches in agent mode
+PUSH_TIMEOUT = 10
 
 
 def load_known_devices():
-    if os.path.exists(KNOWN_DEVICES_FILE):
-        with open(KNOWN_DEVICES_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+    # The app journals whitelist changes next to the file, so replay them too.
+    return JournalMap(KNOWN_DEVICES_FILE, compact_every=None).data()
 
 
 def save_log(entry):
@@ -23,16 +31,62 @@ def save_log(entry):
 
 
 def scan_network():
-    # Run arp to get devices on local network
-    output = subprocess.check_output(['arp', '-a']).decode()
-    devices = []
-    for line in output.splitlines():
-        parts = line.split()
-        if len(parts) >= 3:
-            ip = parts[1].strip('()')
-            mac = parts[3]
-            devices.append({'ip': ip, 'mac': mac})
-    return devices
+    return scan_neighbors(NEIGHBOR_BACKEND)
+
+
+class Agent:
+    """Scans locally and pushes batches to a central app's /ingest endpoint.
+
+    Between pushes only the latest sighting of each MAC is kept, so a batch is one row per
+    device no matter how many scans it covers. A failed push keeps the rows for the next one.
+    Needs only the standard library and neighbor_table, not Flask.
+    """
+
+    def __init__(self, url, sensor, token, push_interval=PUSH_INTERVAL):
+        self.url = url.rstrip('/') + '/ingest'
+        self.sensor = sensor
+        self.token = token
+        self.push_interval = push_interval
+        self.pending = {}  # mac -> (ip, iface, monotonic time seen)
+        self.seq = 0
+
+    def observe(self, devices):
+        now = time.monotonic()
+        for d in devices:
+            self.pending[d['mac']] = (d['ip'], d.get('iface', ''), now)
+
+    def push(self):
+        now = time.monotonic()
+        rows = [[ip, mac, iface, round(now - seen, 1)] for mac, (ip, iface, seen) in self.pending.items()]
+        self.seq += 1
+        request = urllib.request.Request(self.url, data=encode_batch(self.sensor, rows, self.push_interval, self.seq),
+                                         headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip',
+                                                  'Authorization': f'Bearer {self.token}'})
+        try:
+            with urllib.request.urlopen(request, timeout=PUSH_TIMEOUT) as response:
+                response.read()
+        except (urllib.error.URLError, OSError) as e:
+            print(f"[!] Push failed, keeping {len(rows)} rows: {e}")
+            return False
+        self.pending.clear()
+        return True
+
+    def run(self, scan_interval=SCAN_INTERVAL):
+        next_push = time.monotonic()
+        while True:
+            # A failed scan or push loses nothing: pending rows wait for the next interval.
+            try:
+                self.observe(scan_network())
+            except (OSError, ValueError) as e:
+                print(f"[!] Scan failed: {e}")
+            if time.monotonic() >= next_push:
+                try:
+                    if self.push():
+                        print(f"[+] Pushed batch {self.seq} to {self.url}")
+                except (OSError, ValueError) as e:
+                    print(f"[!] Push failed, keeping {len(self.pending)} rows: {e}")
+                next_push = time.monotonic() + self.push_interval
+            time.sleep(scan_interval)
 
 
 def main():
@@ -62,4 +116,16 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Scan the local network; with --agent, push scans to a central app.')
+    parser.add_argument('--agent', metavar='URL', help='central app URL, e.g. http://central:5000')
+    parser.add_argument('--sensor', default=socket.gethostname(), help='name of this sensor (default: hostname)')
+    parser.add_argument('--token', default=os.environ.get('GEOFENCE_SENSOR_TOKEN'),
+                        help='shared ingestion token (default: $GEOFENCE_SENSOR_TOKEN)')
+    parser.add_argument('--push-interval', type=float, default=PUSH_INTERVAL)
+    args = parser.parse_args()
+    if args.agent:
+        if not args.token:
+            parser.error('--agent needs --token or GEOFENCE_SENSOR_TOKEN')
+        Agent(args.agent, args.sensor, args.token, args.push_interval).run()
+    else:
+        main()
@@ -0,0 +1,80 @@
+import json
+import threading
+from collections import deque
+
+BACKLOG = 512  # frames kept for clients resuming with Last-Event-ID
+HEARTBEAT = 15  # seconds between keep-alive comments on an idle stream
+KEEPALIVE = b': keep-alive\n\n'
+
+
+def encode_frame(seq, event, data):
+    return f'id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+class EventBroker:
+    """One shared fan-out for Server-Sent Events.
+
+    A change is encoded into an SSE frame once, when it is published, and appended to a
+    bounded backlog; every subscriber just writes out the frames it has not sent yet. The
+    current state is kept as one pre-encoded `snapshot` frame too, so a new or resyncing
+    subscriber costs no more than a delta.
+    """
+
+    def __init__(self, backlog=BACKLOG, heartbeat=HEARTBEAT):
+        self.heartbeat = heartbeat
+        self.subscribers = 0
+        self._cond = threading.Condition()
+        self._frames = deque(maxlen=backlog)
+        self._seq = 0
+        self._snapshot = None
+
+    def publish(self, event, data):
+        with self._cond:
+            self._seq += 1
+            self._frames.append((self._seq, encode_frame(self._seq, event, data)))
+            self._cond.notify_all()
+
+    def set_snapshot(self, data):
+        # Stamped with the current sequence so a client resumes right after it.
+        with self._cond:
+            self._snapshot = (self._seq, encode_frame(self._seq, 'snapshot', data))
+
+    def _pending(self, after):
+        # Frames newer than `after`, or None when the client cannot resume from it: some frames
+        # were already dropped from the backlog, or the id comes from before a server restart.
+        if after == self._seq:
+            return []
+        if after > self._seq or not self._frames or self._frames[0][0] > after + 1:
+            return None
+        size = len(self._frames)
+        return [self._frames[i][1] for i in range(size - (self._seq - after), size)]
+
+    def _catch_up(self, after):
+        frames = None if after is None else self._pending(after)
+        if frames is None:
+            # A new client, or one that fell too far behind: start over from the snapshot.
+            if self._snapshot is None:
+                return self._seq, []
+            seq, snapshot = self._snapshot
+            frames = [snapshot] + (self._pending(seq) or [])
+        return self._seq, frames
+
+    def stream(self, last_event_id=None):
+        """Generator of SSE frames for one client, starting with a snapshot unless it can resume."""
+        try:
+            after = int(last_event_id)
+        except (TypeError, ValueError):
+            after = None
+        with self._cond:
+            self.subscribers += 1
+        try:
+            while True:
+                with self._cond:
+                    after, frames = self._catch_up(after)
+                    if not frames and not self._cond.wait_for(lambda: self._seq > after, self.heartbeat):
+                        frames = [KEEPALIVE]
+                for frame in frames:
+                    yield frame
+        finally:
+            with self._cond:
+                self.subscribers -= 1
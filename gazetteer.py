@@ -0,0 +1,217 @@
+import bisect
+import csv
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from array import array
+
+from config_cache import file_stamp
+
+TOKEN_RE = re.compile(r'\w+')
+PREFIX_EXPANSIONS = 64  # most frequent completions tried for a prefix token
+FUZZY_MIN_LENGTH = 4  # shorter tokens only match exactly or as prefixes
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+
+NAME_COLUMNS = ('name', 'title')
+DISPLAY_COLUMNS = ('display_name', 'address', 'label')
+ALT_COLUMNS = ('alternatenames', 'alt_names', 'alt_name')
+LAT_COLUMNS = ('lat', 'latitude', 'y')
+LON_COLUMNS = ('lon', 'lng', 'long', 'longitude', 'x')
+TYPE_COLUMNS = ('type', 'class', 'feature_class', 'place')
+
+
+def tokens(text):
+    """Lower-cased, accent-free word tokens: 'Zürich Hbf' -> ['zurich', 'hbf']."""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text.lower())
+
+
+def deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _column(row, names):
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def read_places(path):
+    """Rows of a CSV/TSV place extract as dicts; needs name and lat/lon columns, the rest is optional."""
+    with open(path, newline='', encoding='utf-8') as f:
+        first = f.readline()
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter='\t' if '\t' in first else ',')
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        for row in reader:
+            name = _column(row, NAME_COLUMNS)
+            try:
+                lat, lon = float(_column(row, LAT_COLUMNS)), float(_column(row, LON_COLUMNS))
+            except (TypeError, ValueError):
+                continue
+            if not name or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                continue
+            try:
+                importance = float(row.get('importance') or 0)
+            except ValueError:
+                importance = 0.0
+            if not importance and row.get('population'):
+                try:
+                    importance = min(1.0, math.log10(float(row['population']) + 1) / 8)
+                except ValueError:
+                    pass
+            yield {'name': name, 'display_name': _column(row, DISPLAY_COLUMNS) or name,
+                   'alt_names': _column(row, ALT_COLUMNS) or '', 'lat': lat, 'lon': lon,
+                   'type': _column(row, TYPE_COLUMNS) or '', 'importance': importance}
+
+
+class Gazetteer:
+    """In-memory inverted index over place names, for offline geocoding.
+
+    Each normalized token maps to the ids of the places whose name, display name or
+    alternate names contain it. Query tokens match exactly, the last one also as a prefix
+    (type-ahead), and tokens with no match fall back to edit distance 1 through a deletion
+    index. Every query token must match; places are ranked by the idf-weighted match quality
+    of their tokens, a bonus for an exact name match, and the place's importance.
+    """
+
+    def __init__(self, places):
+        self.names = []
+        self.display_names = []
+        self.types = []
+        self.lats = array('d')
+        self.lons = array('d')
+        self.importance = array('d')
+        postings = {}
+        self.exact_names = {}
+        for pid, place in enumerate(places):
+            self.names.append(place['name'])
+            self.display_names.append(place.get('display_name') or place['name'])
+            self.types.append(place.get('type', ''))
+            self.lats.append(place['lat'])
+            self.lons.append(place['lon'])
+            self.importance.append(place.get('importance', 0.0))
+            text = f"{place['name']} {place.get('display_name', '')} {place.get('alt_names', '')}"
+            for token in set(tokens(text)):
+                postings.setdefault(token, array('I')).append(pid)
+            self.exact_names.setdefault(' '.join(tokens(place['name'])), array('I')).append(pid)
+        self.postings = postings
+        self.vocab = sorted(postings)
+        self._deletes = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(read_places(path))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _idf(self, term):
+        return math.log(1 + len(self.names) / len(self.postings[term]))
+
+    def _fuzzy_index(self):
+        # Built on first use: single-character deletions of each token -> tokens.
+        if self._deletes is None:
+            with self._lock:
+                if self._deletes is None:
+                    deletes = {}
+                    for term in self.vocab:
+                        if len(term) >= FUZZY_MIN_LENGTH:
+                            for d in deletions(term):
+                                deletes.setdefault(d, []).append(term)
+                    self._deletes = deletes
+        return self._deletes
+
+    def _terms(self, token, prefix):
+        # (vocabulary term, match weight) pairs for one query token.
+        if token in self.postings:
+            found = [(token, 1.0)]
+        else:
+            found = []
+        if prefix:
+            i = bisect.bisect_left(self.vocab, token)
+            completions = []
+            while i < len(self.vocab) and self.vocab[i].startswith(token):
+                if self.vocab[i] != token:
+                    completions.append(self.vocab[i])
+                i += 1
+            if len(completions) > PREFIX_EXPANSIONS:
+                completions = heapq.nlargest(PREFIX_EXPANSIONS, completions, key=lambda t: len(self.postings[t]))
+            found.extend((t, PREFIX_WEIGHT) for t in completions)
+        if not found and len(token) >= FUZZY_MIN_LENGTH:
+            deletes = self._fuzzy_index()
+            close = set(deletes.get(token, ()))
+            for d in deletions(token):
+                if d in self.postings:
+                    close.add(d)
+                close.update(deletes.get(d, ()))
+            found.extend((t, FUZZY_WEIGHT) for t in sorted(close))
+        return found
+
+    def search(self, query, limit=5):
+        """Best matching places, best first, as Nominatim-style result dicts."""
+        query_tokens = tokens(query)
+        if not query_tokens:
+            return []
+        per_token = []
+        for k, token in enumerate(query_tokens):
+            weights = {}
+            for term, quality in self._terms(token, prefix=k == len(query_tokens) - 1):
+                w = quality * self._idf(term)
+                for pid in self.postings[term]:
+                    if weights.get(pid, 0.0) < w:
+                        weights[pid] = w
+            if not weights:
+                return []
+            per_token.append(weights)
+        # Intersect starting from the most selective token.
+        per_token.sort(key=len)
+        scores = dict(per_token[0])
+        for weights in per_token[1:]:
+            scores = {pid: s + weights[pid] for pid, s in scores.items() if pid in weights}
+            if not scores:
+                return []
+        exact = frozenset(self.exact_names.get(' '.join(query_tokens), ()))
+        importance = self.importance
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (
+            item[1] + (1.0 if item[0] in exact else 0.0) + importance[item[0]], -item[0]))
+        return [self.place(pid) for pid, _ in ranked]
+
+    def geocode(self, query):
+        found = self.search(query, limit=1)
+        return found[0] if found else None
+
+    def place(self, pid):
+        return {'lat': repr(self.lats[pid]), 'lon': repr(self.lons[pid]), 'name': self.names[pid],
+                'display_name': self.display_names[pid], 'type': self.types[pid],
+                'importance': self.importance[pid], 'source': 'gazetteer'}
+
+
+class GazetteerFile:
+    """A Gazetteer built from a place file and rebuilt when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._index = None
+
+    def index(self):
+        stamp = file_stamp(self.path)
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._index = Gazetteer.from_file(self.path) if stamp is not None else None
+                    self._stamp = stamp
+        return self._index
+
+    def geocode(self, query):
+        index = self.index()
+        return index.geocode(query) if index is not None else None
@@ -0,0 +1,174 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org'
+USER_AGENT = 'GeoFenceMe/1.0'
+TIMEOUT = (3.05, 10)  # connect, read (seconds)
+CACHE_TTL = 30 * 86400  # seconds a found address is served from cache
+MISS_TTL = 3600  # seconds a "not found" answer is remembered
+MEMORY_ENTRIES = 2048
+MIN_INTERVAL = 1.0  # Nominatim usage policy: at most one request per second
+MAX_WAIT = 10.0  # seconds a request may queue for a rate-limit slot before giving up
+
+
+class GeocodeError(Exception):
+    """The upstream geocoder failed or could not be reached."""
+
+
+class GeocoderBusy(GeocodeError):
+    """Too many requests are queued for the upstream rate limit."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Geocoder busy, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+def normalize_query(query):
+    return ' '.join(str(query).lower().split())
+
+
+class NominatimUpstream:
+    """Nominatim-compatible search over one pooled, keep-alive HTTP session.
+
+    Point `base_url` at any server with the same /search API (e.g. a local stand-in in tests).
+    """
+
+    def __init__(self, base_url=NOMINATIM_URL, user_agent=USER_AGENT, timeout=TIMEOUT, pool_size=4):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def search(self, query):
+        """First match as Nominatim returns it, or None."""
+        try:
+            r = self.session.get(f'{self.base_url}/search', params={'format': 'json', 'q': query, 'limit': 1},
+                                 timeout=self.timeout)
+            r.raise_for_status()
+            data = r.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GeocodeError(str(e)) from e
+        return data[0] if data else None
+
+
+class DiskCache:
+    """Persistent query -> result cache in a small SQLite file, with per-entry expiry."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS geocode (query TEXT PRIMARY KEY, result TEXT, expires REAL)')
+        with self._lock:
+            self._db.execute('DELETE FROM geocode WHERE expires < ?', (time.time(),))
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT result, expires FROM geocode WHERE query = ?', (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[1], json.loads(row[0])
+
+    def put(self, key, result, expires):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO geocode (query, result, expires) VALUES (?, ?, ?)',
+                             (key, json.dumps(result), expires))
+
+
+class Geocoder:
+    """Cached, coalescing, rate-limited front for an upstream geocoder.
+
+    Lookups go memory LRU -> disk cache -> upstream. Concurrent requests for the same
+    normalized query share one upstream call, and upstream calls are spaced `min_interval`
+    apart; a request that would queue longer than `max_wait` raises GeocoderBusy instead.
+    Misses are cached for `miss_ttl`; upstream errors are not cached.
+    """
+
+    def __init__(self, upstream, cache_file=None, ttl=CACHE_TTL, miss_ttl=MISS_TTL, max_entries=MEMORY_ENTRIES,
+                 min_interval=MIN_INTERVAL, max_wait=MAX_WAIT):
+        self.upstream = upstream
+        self.disk = DiskCache(cache_file) if cache_file else None
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        self.min_interval = min_interval
+        self.max_wait = max_wait
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (expires, result)
+        self._inflight = {}
+        self._rate_lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _cached(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._memory.move_to_end(key)
+                    return entry
+                del self._memory[key]
+        entry = self.disk.get(key) if self.disk else None
+        if entry is not None:
+            self._remember(key, *entry)
+        return entry
+
+    def _remember(self, key, expires, result):
+        with self._lock:
+            self._memory[key] = (expires, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _wait_for_slot(self):
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            if slot - now > self.max_wait:
+                raise GeocoderBusy(slot - now)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def geocode(self, query):
+        """Best match for `query` (a Nominatim-style dict) or None."""
+        key = normalize_query(query)
+        entry = self._cached(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+        self.misses += 1
+        try:
+            self._wait_for_slot()
+            result = self.upstream.search(query)
+            expires = time.time() + (self.ttl if result else self.miss_ttl)
+            self._remember(key, expires, result)
+            if self.disk:
+                self.disk.put(key, result, expires)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
@@ -0,0 +1,195 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Polygons with fewer edges than this are tested in plain Python; NumPy call
+# overhead only pays off once there are enough edges to vectorize over.
+VECTOR_MIN_EDGES = 24
+MAX_CELLS_PER_POLYGON = 256
+MIN_CELL_SIZE = 1e-4  # degrees
+BROADCAST_CELLS = 1 << 18
+BATCH_MIN_POINTS = 8
+
+
+def polygon_points(coords):
+    points = []
+    for c in coords:
+        if isinstance(c, dict):
+            points.append((float(c['lon']), float(c['lat'])))
+        else:
+            points.append((float(c[1]), float(c[0])))
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def point_in_ring(x, y, xs, ys):
+    inside = False
+    j = len(xs) - 1
+    for i in range(len(xs)):
+        yi, yj = ys[i], ys[j]
+        if (yi > y) != (yj > y) and x < (xs[j] - xs[i]) * (y - yi) / (yj - yi) + xs[i]:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Polygon:
+    """A ring prepared for repeated containment tests (x = lon, y = lat; not closed)."""
+
+    __slots__ = ('name', 'xs', 'ys', 'bbox', 'edges')
+
+    def __init__(self, name, xs, ys, bbox=None):
+        self.name = name
+        self.xs = xs
+        self.ys = ys
+        self.bbox = bbox or (min(xs), min(ys), max(xs), max(ys))
+        self.edges = None
+        if np is not None:
+            x1 = np.array(self.xs)
+            y1 = np.array(self.ys)
+            x0, y0 = np.roll(x1, 1), np.roll(y1, 1)
+            dy = y0 - y1
+            # Slope of each edge as x per unit y; horizontal edges never cross a ray.
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope = np.where(dy != 0, (x0 - x1) / dy, 0.0)
+            self.edges = (x1, y1, y0, slope)
+
+    def contains(self, x, y):
+        minx, miny, maxx, maxy = self.bbox
+        if x < minx or x > maxx or y < miny or y > maxy:
+            return False
+        if self.edges is not None and len(self.xs) >= VECTOR_MIN_EDGES:
+            x1, y1, y0, slope = self.edges
+            crosses = (y1 > y) != (y0 > y)
+            crosses &= x < slope * (y - y1) + x1
+            return bool(np.count_nonzero(crosses) & 1)
+        return point_in_ring(x, y, self.xs, self.ys)
+
+    def contains_many(self, xs, ys):
+        # Bounding-box filter first, then test the surviving points in bulk.
+        minx, miny, maxx, maxy = self.bbox
+        result = np.zeros(len(xs), dtype=bool)
+        candidates = np.flatnonzero((xs >= minx) & (xs <= maxx) & (ys >= miny) & (ys <= maxy))
+        if not len(candidates):
+            return result
+        x1, y1, y0, slope = self.edges
+        # Broadcast points against edges, chunked so the temporary matrix stays small.
+        step = max(1, BROADCAST_CELLS // len(x1))
+        inside = np.empty(len(candidates), dtype=bool)
+        for start in range(0, len(candidates), step):
+            chunk = candidates[start:start + step]
+            px = xs[chunk, None]
+            py = ys[chunk, None]
+            crosses = ((y1 > py) != (y0 > py)) & (px < slope * (py - y1) + x1)
+            inside[start:start + step] = np.count_nonzero(crosses, axis=1) & 1
+        result[candidates] = inside
+        return result
+
+
+class GPSZoneIndex:
+    """Uniform grid over polygon bounding boxes, answering "which gps zones contain this point"."""
+
+    def __init__(self, zones, cell_size=None):
+        polygons = []
+        for name, zone in zones.items():
+            if zone.get('type') != 'gps':
+                continue
+            try:
+                points = polygon_points(zone.get('coords', []))
+            except (KeyError, TypeError, ValueError, IndexError):
+                print(f"Warning: skipping zone {name} with invalid coordinates.")
+                continue
+            if len(points) < 3:
+                continue
+            polygons.append(Polygon(name, [p[0] for p in points], [p[1] for p in points]))
+        self._build(polygons, cell_size)
+
+    @classmethod
+    def from_polygons(cls, polygons, cell_size=None):
+        # Polygons prepared elsewhere (zone_geometry) are indexed as they are, without re-parsing.
+        index = cls.__new__(cls)
+        index._build(list(polygons), cell_size)
+        return index
+
+    def _build(self, polygons, cell_size):
+        self.polygons = polygons
+        self.cell_size = cell_size or self._pick_cell_size()
+        self._grid = {}
+        self._oversized = []
+        for i, poly in enumerate(self.polygons):
+            cells = self._cells(poly.bbox)
+            if cells is None:
+                self._oversized.append(i)
+                continue
+            for cell in cells:
+                self._grid.setdefault(cell, []).append(i)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def _pick_cell_size(self):
+        # Cells about the size of a typical zone keep each polygon in a handful of cells.
+        if not self.polygons:
+            return 1.0
+        spans = sorted(max(p.bbox[2] - p.bbox[0], p.bbox[3] - p.bbox[1]) for p in self.polygons)
+        return max(spans[len(spans) // 2], MIN_CELL_SIZE)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _cells(self, bbox):
+        x0, y0 = self._cell(bbox[0], bbox[1])
+        x1, y1 = self._cell(bbox[2], bbox[3])
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_CELLS_PER_POLYGON:
+            return None
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def candidates(self, lat, lon):
+        found = self._grid.get(self._cell(lon, lat), ())
+        if self._oversized:
+            return list(found) + self._oversized
+        return found
+
+    def zones_at(self, lat, lon):
+        polygons = self.polygons
+        return [polygons[i].name for i in sorted(self.candidates(lat, lon)) if polygons[i].contains(lon, lat)]
+
+    def zones_at_many(self, lats, lons):
+        """Return one list of zone names per (lat, lon) pair."""
+        n = len(lats)
+        result = [[] for _ in range(n)]
+        if not n or not self.polygons:
+            return result
+        if np is None:
+            for k in range(n):
+                result[k] = self.zones_at(lats[k], lons[k])
+            return result
+        xs = np.asarray(lons, dtype=float)
+        ys = np.asarray(lats, dtype=float)
+        # Group points by cell so each candidate polygon is tested once against all its points.
+        cx = np.floor(xs / self.cell_size).astype(np.int64)
+        cy = np.floor(ys / self.cell_size).astype(np.int64)
+        by_polygon = {}
+        for k, cell in enumerate(zip(cx.tolist(), cy.tolist())):
+            for i in self._grid.get(cell, ()):
+                by_polygon.setdefault(i, []).append(k)
+        everyone = list(range(n))
+        for i in self._oversized:
+            by_polygon[i] = everyone
+        for i in sorted(by_polygon):
+            poly = self.polygons[i]
+            points = by_polygon[i]
+            if len(points) < BATCH_MIN_POINTS:
+                for k in points:
+                    if poly.contains(lons[k], lats[k]):
+                        result[k].append(poly.name)
+                continue
+            points = np.asarray(points)
+            hits = poly.contains_many(xs[points], ys[points])
+            for k in points[hits].tolist():
+                result[k].append(poly.name)
+        return result
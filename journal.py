@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+
+from config_cache import file_stamp, write_json_atomic
+
+COMPACT_EVERY = 500  # journal records
+
+
+class JournalMap:
+    """A JSON object file kept as snapshot + append-only journal of small delta records.
+
+    Each write appends one line, `{"set": {...}, "del": [...]}`, so its cost follows the size
+    of the change rather than the whole map. Every `compact_every` records the map is written
+    to a temporary file and renamed over the snapshot, then the journal is truncated. Loading
+    replays the journal over the snapshot; a torn final line from a crash is ignored, and since
+    records are idempotent a crash between rename and truncate replays harmlessly.
+
+    Writes mutate the map returned by data() in place and bump `version`; threads that may
+    race a writer should iterate snapshot() instead, and caches should key on `version`.
+    Pass compact_every=None for read-only users: they never rewrite or truncate the files.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY, fsync=True):
+        self.path = path
+        self.journal_path = f'{path}.journal'
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.version = 0
+        self._lock = threading.Lock()
+        self._data = {}
+        self._records = 0
+        self._stamp = None
+        self.load()
+
+    def load(self):
+        writer = self.compact_every is not None
+        with self._lock:
+            data = self._read_snapshot()
+            records = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'rb+' if writer else 'rb') as f:
+                    good = 0
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # The owner drops the torn tail so later appends start on a clean line;
+                            # a reader may be looking at a record still being written, and skips it.
+                            if writer:
+                                print(f"Warning: discarding torn record in {self.journal_path}.")
+                                f.truncate(good)
+                            break
+                        self._apply(data, record)
+                        records += 1
+                        good += len(line)
+            self._data = data
+            self._records = records
+            self._stamp = file_stamp(self.path)
+            self.version += 1
+        if writer and records >= self.compact_every:
+            self.compact()
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {self.path} is empty or corrupted. Replaying journal over an empty map.")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    @staticmethod
+    def _apply(data, record):
+        data.update(record.get('set', {}))
+        for key in record.get('del', ()):
+            data.pop(key, None)
+
+    def data(self):
+        # Someone edited the snapshot by hand: start over from it.
+        if file_stamp(self.path) != self._stamp:
+            self.load()
+        return self._data
+
+    def snapshot(self):
+        """(version, copy of the map), taken under the writer's lock."""
+        self.data()
+        with self._lock:
+            return self.version, dict(self._data)
+
+    def update(self, changes=None, deletes=()):
+        with self._lock:
+            current = self._data
+            changes = {k: v for k, v in (changes or {}).items() if current.get(k, self) != v}
+            deletes = [k for k in deletes if k in current]
+            if not changes and not deletes:
+                return False
+            record = {}
+            if changes:
+                record['set'] = changes
+            if deletes:
+                record['del'] = deletes
+            with open(self.journal_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._apply(current, record)
+            self._records += 1
+            self.version += 1
+            compact = self.compact_every is not None and self._records >= self.compact_every
+        if compact:
+            self.compact()
+        return True
+
+    def replace(self, data):
+        # Journal only the difference between the current map and `data`.
+        current = self.data()
+        return self.update(data, [k for k in current if k not in data])
+
+    def set(self, key, value):
+        return self.update({key: value})
+
+    def delete(self, key):
+        return self.update(deletes=[key])
+
+    def compact(self):
+        with self._lock:
+            write_json_atomic(self.path, self._data)
+            with open(self.journal_path, 'w'):
+                pass
+            self._records = 0
+            self._stamp = file_stamp(self.path)
@@ -0,0 +1,239 @@
+import bisect
+import json
+import os
+import threading
+from array import array
+from datetime import datetime
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def event_time(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def query_time(value):
+    """A since/until bound as a naive local ISO timestamp, the form events are logged in; raises ValueError."""
+    if not isinstance(value, str):
+        raise ValueError(f'invalid timestamp {value!r}')
+    when = datetime.fromisoformat(value)
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return when.isoformat()
+
+
+def event_key(event):
+    return event.get('mac') or event.get('device_id')
+
+
+class Series:
+    """Byte offsets of log records kept sorted by event time (ties by offset)."""
+
+    __slots__ = ('times', 'offsets')
+
+    def __init__(self):
+        self.times = array('d')
+        self.offsets = array('q')
+
+    def add(self, t, offset):
+        # Appends are the common case; late events (buffered GPS fixes) are inserted in place.
+        if not self.times or t >= self.times[-1]:
+            self.times.append(t)
+            self.offsets.append(offset)
+            return
+        i = bisect.bisect_right(self.times, t)
+        self.times.insert(i, t)
+        self.offsets.insert(i, offset)
+
+    def position(self, t, offset):
+        # Index of the first entry that sorts after (t, offset).
+        i = bisect.bisect_left(self.times, t)
+        while i < len(self.times) and self.times[i] == t and self.offsets[i] <= offset:
+            i += 1
+        return i
+
+
+class LogIndex:
+    """Sidecar index over a JSONL event log, answering paginated queries by seeking.
+
+    The sidecar (`<log>.idx`) holds one `offset, time, mac, zone, end` line per record and
+    is appended to as the log grows, so startup reads the small sidecar instead of parsing the
+    log. In memory there is one time-ordered Series for the whole log plus one per MAC and per
+    zone; a query bisects the right series and reads only the records on the requested page.
+    """
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.index_path = f'{log_path}.idx'
+        self._lock = threading.Lock()
+        self._reset()
+        self._load_sidecar()
+
+    def reset(self):
+        # Called after the log is rotated away, before anything new is appended.
+        with self._lock:
+            self._reset()
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+
+    def _reset(self):
+        self.all = Series()
+        self.by_mac = {}
+        self.by_zone = {}
+        self.indexed_end = 0
+
+    def _add(self, offset, t, mac, zone):
+        self.all.add(t, offset)
+        if mac:
+            self.by_mac.setdefault(mac, Series()).add(t, offset)
+        if zone:
+            self.by_zone.setdefault(zone, Series()).add(t, offset)
+
+    def _load_sidecar(self):
+        if not os.path.exists(self.index_path):
+            return
+        end = good = 0
+        with open(self.index_path, 'rb+') as f:
+            for line in f:
+                try:
+                    offset, t, mac, zone, stop = line.decode().rstrip('\n').split('\t')
+                    offset, t, stop = int(offset), float(t), int(stop)
+                except ValueError:
+                    f.truncate(good)  # torn last line; the log tail is re-indexed on refresh
+                    break
+                self._add(offset, t, mac, zone)
+                end = stop
+                good += len(line)
+        self.indexed_end = end
+
+    def refresh(self):
+        with self._lock:
+            try:
+                size = os.path.getsize(self.log_path)
+            except FileNotFoundError:
+                size = 0
+            if size < self.indexed_end:
+                # The log was truncated or replaced: start the index over.
+                self._reset()
+                if os.path.exists(self.index_path):
+                    os.remove(self.index_path)
+            if size == self.indexed_end:
+                return
+            lines = []
+            with open(self.log_path, 'rb') as f:
+                f.seek(self.indexed_end)
+                offset = self.indexed_end
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break  # a write in progress; index it next time
+                    end = offset + len(raw)
+                    if raw.strip():
+                        try:
+                            event = json.loads(raw)
+                        except ValueError:
+                            event = {}
+                        t = event_time(event.get('timestamp'))
+                        mac = str(event_key(event) or '')
+                        zone = str(event.get('zone') or '')
+                        self._add(offset, t, mac, zone)
+                        lines.append(f'{offset}\t{t!r}\t{mac}\t{zone}\t{end}\n')
+                    offset = end
+            self.indexed_end = offset
+            if lines:
+                with open(self.index_path, 'a') as f:
+                    f.write(''.join(lines))
+
+    def query(self, since=None, until=None, mac=None, zone=None, cursor=None, limit=DEFAULT_LIMIT, descending=True):
+        """Return (events, next_cursor); cursors are opaque "time:offset" strings."""
+        self.refresh()
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        with self._lock:
+            if mac:
+                series = self.by_mac.get(mac, Series())
+            elif zone:
+                series = self.by_zone.get(zone, Series())
+            else:
+                series = self.all
+            lo = 0 if since is None else bisect.bisect_left(series.times, since)
+            hi = len(series.times) if until is None else bisect.bisect_right(series.times, until)
+            if cursor is not None:
+                t, offset = decode_cursor(cursor)
+                if descending:
+                    hi = min(hi, series.position(t, offset - 1))
+                else:
+                    lo = max(lo, series.position(t, offset))
+            positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+            events = []
+            last = None
+            if positions:
+                with open(self.log_path, 'rb') as f:
+                    for i in positions:
+                        last = i
+                        f.seek(series.offsets[i])
+                        try:
+                            event = json.loads(f.readline())
+                        except ValueError:
+                            continue
+                        # The MAC series already matches; a zone filter on top is checked per record.
+                        if mac and zone and event.get('zone') != zone:
+                            continue
+                        events.append(event)
+                        if len(events) == limit:
+                            break
+            more = last is not None and last != positions[-1]
+            next_cursor = encode_cursor(series.times[last], series.offsets[last]) if more else None
+        return events, next_cursor
+
+    def tail(self, after=0, limit=DEFAULT_LIMIT):
+        """Records appended after byte offset `after`, in file order; returns (events, next_offset)."""
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        events = []
+        if not os.path.exists(self.log_path):
+            return events, 0
+        if after > os.path.getsize(self.log_path):
+            after = 0  # the log was rotated since the caller's last poll
+        with open(self.log_path, 'rb') as f:
+            f.seek(max(0, after))
+            offset = max(0, after)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                offset += len(raw)
+                if raw.strip():
+                    try:
+                        events.append(json.loads(raw))
+                    except ValueError:
+                        continue
+                    if len(events) == limit:
+                        break
+        return events, offset
+
+
+def encode_cursor(t, offset):
+    return f'{t!r}:{offset}'
+
+
+def decode_cursor(value):
+    t, _, offset = value.rpartition(':')
+    return float(t), int(offset)
+
+
+def encode_tail(generation, offset):
+    return f'{generation}:{offset}'
+
+
+def decode_tail(value):
+    """(generation, offset) of a tail cursor; '0' or empty is (None, 0), the top of the active log."""
+    if not value or value == '0':
+        return None, 0
+    generation, sep, offset = str(value).partition(':')
+    if not sep:
+        raise ValueError(f'invalid tail cursor {value!r}')
+    generation, offset = int(generation), int(offset)
+    if generation < 1 or offset < 0:
+        raise ValueError(f'invalid tail cursor {value!r}')
+    return generation, offset
@@ -0,0 +1,217 @@
+import base64
+import glob
+import gzip
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+
+from log_index import event_key, event_time
+
+SEGMENT_MAGIC = b'GFLSEG1\n'
+HEADER_LEN = struct.Struct('>I')
+BLOOM_FP_RATE = 0.01
+
+
+class BloomFilter:
+    def __init__(self, bits, hashes, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, n, fp_rate=BLOOM_FP_RATE):
+        n = max(n, 1)
+        bits = max(64, math.ceil(-n * math.log(fp_rate) / math.log(2) ** 2))
+        return cls(bits, max(1, round(bits / n * math.log(2))))
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.data[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        return all(self.data[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+def write_segment(path, lines):
+    """Write JSONL `lines` (bytes) as one compressed segment with a summary header."""
+    macs, zones = set(), set()
+    lo, hi = math.inf, -math.inf
+    for raw in lines:
+        try:
+            event = json.loads(raw)
+        except ValueError:
+            continue
+        t = event_time(event.get('timestamp'))
+        lo, hi = min(lo, t), max(hi, t)
+        if event_key(event):
+            macs.add(str(event_key(event)))
+        if event.get('zone'):
+            zones.add(str(event['zone']))
+    bloom = BloomFilter.for_capacity(len(macs))
+    for mac in macs:
+        bloom.add(mac)
+    header = json.dumps({
+        'count': len(lines),
+        'min_time': lo if lines else 0.0,
+        'max_time': hi if lines else 0.0,
+        'zones': sorted(zones),
+        'bloom_bits': bloom.bits,
+        'bloom_hashes': bloom.hashes,
+        'bloom': base64.b64encode(bytes(bloom.data)).decode(),
+    }).encode()
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(SEGMENT_MAGIC + HEADER_LEN.pack(len(header)) + header)
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6) as gz:
+            gz.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Segment:
+    """A rotated, gzip-compressed slice of the event log whose header summarizes its contents."""
+
+    def __init__(self, path, seq):
+        self.path = path
+        self.seq = seq
+        with open(path, 'rb') as f:
+            if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+                raise ValueError(f'{path} is not a log segment')
+            (length,) = HEADER_LEN.unpack(f.read(HEADER_LEN.size))
+            header = json.loads(f.read(length))
+            self.body_offset = f.tell()
+        self.count = header['count']
+        self.min_time = header['min_time']
+        self.max_time = header['max_time']
+        self.zones = frozenset(header['zones'])
+        self.bloom = BloomFilter(header['bloom_bits'], header['bloom_hashes'], base64.b64decode(header['bloom']))
+
+    def may_match(self, since=None, until=None, mac=None, zone=None):
+        if since is not None and self.max_time < since:
+            return False
+        if until is not None and self.min_time > until:
+            return False
+        if mac and mac not in self.bloom:
+            return False
+        if zone and zone not in self.zones:
+            return False
+        return True
+
+    def lines(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.body_offset)
+            with gzip.GzipFile(fileobj=f, mode='rb') as gz:
+                yield from gz
+
+    def matches(self, since=None, until=None, mac=None, zone=None):
+        # Yields (line_number, event); a cheap substring test skips most non-matching lines unparsed.
+        needle = json.dumps(mac).encode() if mac else None
+        for n, raw in enumerate(self.lines()):
+            if needle is not None and needle not in raw:
+                continue
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                continue
+            if mac and str(event_key(event)) != mac:
+                continue
+            if zone and event.get('zone') != zone:
+                continue
+            if since is not None or until is not None:
+                t = event_time(event.get('timestamp'))
+                if since is not None and t < since or until is not None and t > until:
+                    continue
+            yield n, event
+
+
+class SegmentStore:
+    """Rotates the active log into numbered segments and keeps at most `max_segments` of them."""
+
+    def __init__(self, log_path, directory=None, max_segments=50):
+        self.log_path = log_path
+        self.directory = directory or os.path.join(os.path.dirname(log_path) or '.', 'log_segments')
+        self.prefix = os.path.basename(log_path)
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._segments = None
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f'{self.prefix}.{seq:06d}.seg')
+
+    def segments(self):
+        """Segments, oldest first."""
+        with self._lock:
+            if self._segments is None:
+                found = []
+                for path in glob.glob(os.path.join(glob.escape(self.directory), f'{glob.escape(self.prefix)}.*.seg')):
+                    try:
+                        found.append(Segment(path, int(path.rsplit('.', 2)[-2])))
+                    except (ValueError, OSError) as e:
+                        print(f"Warning: skipping log segment {path}: {e}")
+                self._segments = sorted(found, key=lambda s: s.seq)
+            return list(self._segments)
+
+    def generation(self):
+        """Sequence number the active log will get when it is rotated; it changes on every rotation."""
+        segments = self.segments()
+        return segments[-1].seq + 1 if segments else 1
+
+    def rotate(self):
+        """Compress the active log into a new segment and start an empty one."""
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0:
+            return None
+        self.recover()
+        os.replace(self.log_path, self._rotating)
+        return self._compress()
+
+    def recover(self):
+        # A crash mid-rotation leaves the renamed log behind; finish compressing it.
+        if os.path.exists(self._rotating):
+            return self._compress()
+        return None
+
+    @property
+    def _rotating(self):
+        return f'{self.log_path}.rotating'
+
+    def _compress(self):
+        segments = self.segments()
+        os.makedirs(self.directory, exist_ok=True)
+        seq = segments[-1].seq + 1 if segments else 1
+        rotating = self._rotating
+        with open(rotating, 'rb') as f:
+            lines = [raw if raw.endswith(b'\n') else raw + b'\n' for raw in f if raw.strip()]
+        path = self._path(seq)
+        write_segment(path, lines)
+        os.remove(rotating)
+        segment = Segment(path, seq)
+        with self._lock:
+            self._segments.append(segment)
+            expired = self._segments[:-self.max_segments] if self.max_segments else []
+            self._segments = self._segments[len(expired):]
+        for old in expired:
+            os.remove(old.path)
+        return segment
+
+
+def segment_page(segment, since=None, until=None, mac=None, zone=None, after=None, limit=100, descending=True):
+    """One page of matching events from a segment; returns (events, next_line or None)."""
+    found = list(segment.matches(since, until, mac, zone))
+    if descending:
+        found.reverse()
+        if after is not None:
+            found = [m for m in found if m[0] < after]
+    elif after is not None:
+        found = [m for m in found if m[0] > after]
+    page = found[:limit]
+    next_line = page[-1][0] if len(found) > limit else None
+    return [event for _, event in page], next_line
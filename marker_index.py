@@ -0,0 +1,118 @@
+import math
+import threading
+import uuid
+from itertools import zip_longest
+
+CELL_SIZE = 0.05  # degrees; roughly 5 km cells
+
+
+def new_marker_id():
+    return uuid.uuid4().hex[:16]
+
+
+def coordinate(value, limit):
+    # A finite number within +/-limit degrees, or None.
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) and -limit <= value <= limit else None
+
+
+def marker_position(marker):
+    try:
+        lat, lon = coordinate(marker['lat'], 90), coordinate(marker['lon'], 180)
+    except (KeyError, TypeError):
+        return None
+    return None if lat is None or lon is None else (lat, lon)
+
+
+def valid_update(update):
+    # Partial updates may move a marker along one axis only; whatever is given must be in range.
+    return all(coordinate(update[k], limit) is not None for k, limit in (('lat', 90), ('lon', 180)) if k in update)
+
+
+def round_robin(groups, limit):
+    # One from each group in turn, so a truncated result still draws on every group.
+    sampled = (item for row in zip_longest(*groups) for item in row if item is not None)
+    return [item for _, item in zip(range(limit), sampled)]
+
+
+def sample_evenly(points, limit, cell_size=CELL_SIZE):
+    """Ids of at most `limit` of `points` (id, lat, lon), taken round-robin across grid cells."""
+    cells = {}
+    for pid, lat, lon in points:
+        cells.setdefault((math.floor(lat / cell_size), math.floor(lon / cell_size)), []).append(pid)
+    return round_robin([cells[cell] for cell in sorted(cells)], limit)
+
+
+def lon_ranges(west, east):
+    # A box crossing the antimeridian (west > east) is two longitude ranges.
+    if west <= east:
+        return [(west, east)]
+    return [(west, 180.0), (-180.0, east)]
+
+
+class MarkerGrid:
+    """Uniform lat/lon grid over marker ids, for viewport (bbox) queries.
+
+    Markers are bucketed by cell; a query visits the cells overlapping the box, or the
+    occupied cells when that is fewer (zoomed far out), and checks positions exactly.
+    When more markers match than `limit`, cells are sampled round-robin so a truncated
+    result still covers the whole viewport.
+    """
+
+    def __init__(self, markers=(), cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (row, col) -> {id: (lat, lon)}
+        self.where = {}  # id -> (row, col)
+        self._lock = threading.Lock()
+        for marker in markers:
+            self.add(marker)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def add(self, marker):
+        position = marker_position(marker)
+        with self._lock:
+            self._remove(marker['id'])
+            if position is None:
+                return
+            cell = self._cell(*position)
+            self.cells.setdefault(cell, {})[marker['id']] = position
+            self.where[marker['id']] = cell
+
+    def remove(self, marker_id):
+        with self._lock:
+            self._remove(marker_id)
+
+    def _remove(self, marker_id):
+        cell = self.where.pop(marker_id, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            del bucket[marker_id]
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, south, west, north, east, limit=None):
+        """(ids, total): ids of markers inside the box, at most `limit` of them."""
+        per_cell = []
+        with self._lock:
+            for lo, hi in lon_ranges(west, east):
+                r0, c0 = self._cell(south, lo)
+                r1, c1 = self._cell(north, hi)
+                if (r1 - r0 + 1) * (c1 - c0 + 1) <= len(self.cells):
+                    cells = ((r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+                else:
+                    cells = (cell for cell in self.cells if r0 <= cell[0] <= r1 and c0 <= cell[1] <= c1)
+                for cell in cells:
+                    bucket = self.cells.get(cell)
+                    if bucket:
+                        found = [mid for mid, (lat, lon) in bucket.items() if south <= lat <= north and lo <= lon <= hi]
+                        if found:
+                            per_cell.append(found)
+        total = sum(len(found) for found in per_cell)
+        if limit is None or total <= limit:
+            return [mid for found in per_cell for mid in found], total
+        return round_robin(per_cell, limit), total
@@ -0,0 +1,185 @@
+import re
+import socket
+import struct
+import subprocess
+
+PROC_ARP_FILE = '/proc/net/arp'
+
+# /proc/net/arp flags
+ATF_COM = 0x02
+
+# Netlink / rtnetlink constants (linux/netlink.h, linux/rtnetlink.h, linux/neighbour.h)
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NDA_DST = 1
+NDA_LLADDR = 2
+NUD_INCOMPLETE = 0x01
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+
+NLMSG_HDR = struct.Struct('=IHHII')
+NDMSG = struct.Struct('=BxxxiHBB')
+RTATTR = struct.Struct('=HH')
+
+EMPTY_MAC = '00:00:00:00:00:00'
+
+IP_RE = re.compile(r'(?<![\d.])(\d{1,3}(?:\.\d{1,3}){3})(?![\d.])')
+MAC_RE = re.compile(r'(?<![0-9A-Fa-f:-])([0-9A-Fa-f]{1,2}(?:[:-][0-9A-Fa-f]{1,2}){5})(?![0-9A-Fa-f:-])')
+IFACE_RE = re.compile(r'\bon\s+(\S+)')
+
+
+def normalize_mac(mac):
+    return ':'.join(part.zfill(2) for part in re.split('[:-]', mac.lower()))
+
+
+def parse_proc_arp(text):
+    result = []
+    for line in text.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) < 6:
+            continue
+        try:
+            flags = int(parts[2], 16)
+        except ValueError:
+            continue
+        mac = parts[3].lower()
+        if not flags & ATF_COM or mac == EMPTY_MAC:
+            continue
+        result.append({'ip': parts[0], 'mac': mac, 'iface': parts[5]})
+    return result
+
+
+def parse_arp_output(text):
+    result = []
+    for line in text.splitlines():
+        parts = line.split()
+        # Fast path for the common "? (ip) at mac [ether] on iface" layout.
+        if len(parts) >= 4 and parts[2] == 'at' and parts[1][:1] == '(' and len(parts[3]) == 17:
+            mac = parts[3].lower()
+            if mac == EMPTY_MAC:
+                continue
+            iface = parts[parts.index('on') + 1] if 'on' in parts[4:-1] else None
+            result.append({'ip': parts[1][1:-1], 'mac': mac, 'iface': iface})
+            continue
+        # Otherwise match addresses by shape rather than column position, so BSD and
+        # Windows layouts parse too and "<incomplete>" rows are dropped.
+        ip = IP_RE.search(line)
+        mac = MAC_RE.search(line)
+        if not ip or not mac:
+            continue
+        mac = normalize_mac(mac.group(1))
+        if mac == EMPTY_MAC:
+            continue
+        iface = IFACE_RE.search(line)
+        result.append({'ip': ip.group(1), 'mac': mac, 'iface': iface.group(1) if iface else None})
+    return result
+
+
+def parse_netlink_neighbors(data, ifnames=None):
+    if ifnames is None:
+        ifnames = {}
+    result = []
+    offset = 0
+    end = len(data)
+    while offset + NLMSG_HDR.size <= end:
+        length, msg_type, _, _, _ = NLMSG_HDR.unpack_from(data, offset)
+        if length < NLMSG_HDR.size:
+            break
+        if msg_type == NLMSG_DONE:
+            break
+        if msg_type == NLMSG_ERROR:
+            raise OSError('netlink neighbor dump failed')
+        if msg_type == RTM_NEWNEIGH:
+            body = offset + NLMSG_HDR.size
+            family, ifindex, state, _, _ = NDMSG.unpack_from(data, body)
+            if family == socket.AF_INET and not state & (NUD_INCOMPLETE | NUD_FAILED | NUD_NOARP):
+                ip = mac = None
+                attr = body + NDMSG.size
+                msg_end = offset + length
+                while attr + RTATTR.size <= msg_end:
+                    attr_len, attr_type = RTATTR.unpack_from(data, attr)
+                    if attr_len < RTATTR.size:
+                        break
+                    payload = data[attr + RTATTR.size:attr + attr_len]
+                    if attr_type == NDA_DST and len(payload) == 4:
+                        ip = socket.inet_ntoa(payload)
+                    elif attr_type == NDA_LLADDR and len(payload) == 6:
+                        mac = payload.hex(':')
+                    attr += (attr_len + 3) & ~3
+                if ip and mac and mac != EMPTY_MAC:
+                    if ifindex not in ifnames:
+                        try:
+                            ifnames[ifindex] = socket.if_indextoname(ifindex)
+                        except OSError:
+                            ifnames[ifindex] = None
+                    result.append({'ip': ip, 'mac': mac, 'iface': ifnames[ifindex]})
+        offset += (length + 3) & ~3
+    return result
+
+
+def read_netlink():
+    if not hasattr(socket, 'AF_NETLINK'):
+        raise OSError('netlink is not available on this platform')
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.settimeout(2)
+        sock.bind((0, 0))
+        body = NDMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        header = NLMSG_HDR.pack(NLMSG_HDR.size + len(body), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, 1, 0)
+        sock.send(header + body)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            # The dump ends with an NLMSG_DONE message in the last datagram.
+            if _ends_dump(chunk):
+                break
+    return parse_netlink_neighbors(b''.join(chunks))
+
+
+def _ends_dump(chunk):
+    offset = 0
+    while offset + NLMSG_HDR.size <= len(chunk):
+        length, msg_type, _, _, _ = NLMSG_HDR.unpack_from(chunk, offset)
+        if msg_type in (NLMSG_DONE, NLMSG_ERROR):
+            return True
+        if length < NLMSG_HDR.size:
+            return True
+        offset += (length + 3) & ~3
+    return False
+
+
+def read_proc_arp(path=PROC_ARP_FILE):
+    with open(path, 'r') as f:
+        return parse_proc_arp(f.read())
+
+
+def read_arp_command():
+    output = subprocess.check_output(['arp', '-a'], stderr=subprocess.DEVNULL)
+    return parse_arp_output(output.decode(errors='replace'))
+
+
+BACKENDS = {
+    'netlink': read_netlink,
+    'proc': read_proc_arp,
+    'arp': read_arp_command,
+}
+BACKEND_ORDER = ('proc', 'netlink', 'arp')
+
+
+def scan_neighbors(backend='auto'):
+    if backend != 'auto':
+        return BACKENDS[backend]()
+    last_error = None
+    for name in BACKEND_ORDER:
+        try:
+            return BACKENDS[name]()
+        except (OSError, subprocess.SubprocessError) as e:
+            last_error = e
+    raise OSError(f'no neighbor table backend available: {last_error}')
@@ -0,0 +1,157 @@
+import threading
+import time
+
+DEFAULTS = {
+    'grace_period': 60,          # seconds a device may be missing from scans before it counts as gone
+    'confirm_scans': 2,          # consecutive scans a new inside/outside reading must hold
+    'forget_after': 86400,       # seconds after which a vanished device is dropped from state
+    'device_alert_interval': 120,  # minimum seconds between alerts for the same device
+    'alerts_per_minute': 20,     # global alert budget (token bucket); 0 disables the limit
+}
+SCAN_FIELDS = ('last_seen', 'ip')  # refreshed on every scan a device is present
+STATE_FLUSH_INTERVAL = 300  # seconds between writes of entries whose only change is a SCAN_FIELDS refresh
+
+
+def presence_config(config):
+    return {**DEFAULTS, **(config or {})}
+
+
+def without_scan_fields(entry):
+    return {k: v for k, v in entry.items() if k not in SCAN_FIELDS}
+
+
+class StateWriteBehind:
+    """Holds the tracker's latest state in memory and picks which entries a store must write.
+
+    observe() refreshes `last_seen` and `ip` for every present device on every scan, so
+    writing state through would rewrite every device each scan. An entry is written at once
+    when anything else changed (presence, inside/zone, debounce or alert bookkeeping) and
+    otherwise every `flush_interval` seconds, so a restart loses at most that much of
+    last_seen. `token` is the store's version of what it persisted: when it moves without
+    us (the file was edited, another process wrote), the persisted state wins again.
+    """
+
+    def __init__(self, flush_interval=STATE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._state = None
+        self._token = None
+        self._flushed = time.monotonic()
+
+    def current(self, persisted, token):
+        return self._state if self._state is not None and self._token == token else persisted
+
+    def changes(self, persisted, state, flush=False):
+        """(changes, deletes) to write so `persisted` catches up with `state`."""
+        if flush or time.monotonic() - self._flushed >= self.flush_interval:
+            flush = True
+            self._flushed = time.monotonic()
+        changes = {}
+        for mac, entry in state.items():
+            old = persisted.get(mac)
+            if old != entry and (flush or old is None or without_scan_fields(old) != without_scan_fields(entry)):
+                changes[mac] = entry
+        return changes, [mac for mac in persisted if mac not in state]
+
+    def keep(self, state, token):
+        self._state = state
+        self._token = token
+
+
+class PresenceTracker:
+    """Per-device presence state machine with debouncing and alert rate limits.
+
+    State lives in plain dicts keyed by MAC (the last_seen store), one per device:
+    `inside`/`zone` are the confirmed reading, `candidate`/`streak` track a reading that
+    has not held for `confirm_scans` scans yet, and `present` drops to False only after
+    the device has been missing for `grace_period` seconds. A device that blinks out of
+    one ARP snapshot therefore neither vanishes nor re-alerts when it comes back.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._refilled = time.monotonic()
+
+    def observe(self, state, observations, config=None, now=None, alertable=None):
+        """Fold one scan into `state`; return (new_state, transitions).
+
+        `observations` maps MAC to {'ip', 'zone', 'inside'}. Each transition is a dict with
+        mac, ip, zone, inside, event ('entry', 'exit' or 'vanished') and `alert`, which is
+        False when rate limited or when `alertable(mac)` says the device never alerts.
+        """
+        cfg = presence_config(config)
+        cfg['alertable'] = alertable
+        now = time.time() if now is None else now
+        new_state = {}
+        transitions = []
+        for mac, obs in observations.items():
+            prev = state.get(mac)
+            if prev is None:
+                entry = {'inside': obs['inside'], 'zone': obs['zone'], 'present': True,
+                         'first_seen': now, 'last_seen': now, 'ip': obs['ip']}
+                transitions.append(self._transition(entry, mac, obs, 'entry' if obs['inside'] else 'exit', cfg, now))
+                new_state[mac] = entry
+                continue
+            entry = {**prev, 'present': True, 'last_seen': now, 'ip': obs['ip']}
+            entry.setdefault('first_seen', now)
+            if obs['inside'] == prev.get('inside'):
+                entry['zone'] = obs['zone'] if obs['inside'] else prev.get('zone', obs['zone'])
+                entry.pop('candidate', None)
+                entry.pop('streak', None)
+            else:
+                streak = prev.get('streak', 0) + 1 if prev.get('candidate') == obs['inside'] else 1
+                # A device coming back after it vanished needs no confirmation.
+                if streak >= cfg['confirm_scans'] or not prev.get('present', True) or prev.get('inside') is None:
+                    entry.pop('candidate', None)
+                    entry.pop('streak', None)
+                    entry['inside'] = obs['inside']
+                    entry['zone'] = obs['zone'] if obs['inside'] else prev.get('zone', obs['zone'])
+                    transitions.append(self._transition(entry, mac, obs, 'entry' if obs['inside'] else 'exit', cfg, now))
+                else:
+                    entry['candidate'] = obs['inside']
+                    entry['streak'] = streak
+            new_state[mac] = entry
+
+        for mac, prev in state.items():
+            if mac in observations:
+                continue
+            missing = now - prev.get('last_seen', now)
+            if missing > cfg['forget_after']:
+                continue
+            entry = dict(prev)
+            entry.pop('candidate', None)
+            entry.pop('streak', None)
+            if prev.get('present', True) and missing > cfg['grace_period']:
+                entry['present'] = False
+                if prev.get('inside'):
+                    obs = {'ip': prev.get('ip'), 'zone': prev.get('zone', 'none'), 'inside': False}
+                    entry['inside'] = False
+                    transitions.append(self._transition(entry, mac, obs, 'vanished', cfg, now))
+            entry.setdefault('last_seen', now)
+            new_state[mac] = entry
+        return new_state, transitions
+
+    def _transition(self, entry, mac, obs, event, cfg, now):
+        alertable = cfg['alertable']
+        allowed = (alertable is None or alertable(mac)) and self._allow(entry, cfg, now)
+        if allowed:
+            entry['last_alert'] = now
+        return {'mac': mac, 'ip': obs['ip'], 'zone': obs['zone'], 'inside': obs['inside'],
+                'event': event, 'alert': allowed}
+
+    def _allow(self, entry, cfg, now):
+        if now - entry.get('last_alert', float('-inf')) < cfg['device_alert_interval']:
+            return False
+        rate = cfg['alerts_per_minute']
+        if not rate:
+            return True
+        with self._lock:
+            tick = time.monotonic()
+            if self._tokens is None:
+                self._tokens = float(rate)
+            self._tokens = min(float(rate), self._tokens + (tick - self._refilled) * rate / 60.0)
+            self._refilled = tick
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+MAX_PROFILE_SECONDS = 60
+MAX_STACK_DEPTH = 128
+
+_local = threading.local()
+
+
+class Trace:
+    """Named spans timed on one thread, rendered as a Server-Timing header."""
+
+    __slots__ = ('spans', 'started')
+
+    def __init__(self):
+        self.spans = []  # (name, seconds, description)
+        self.started = time.perf_counter()
+
+    def add(self, name, seconds, description=None):
+        self.spans.append((name, seconds, description))
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, extra=()):
+        parts = []
+        for name, seconds, description in list(self.spans) + list(extra):
+            part = f'{name};dur={seconds * 1000:.2f}'
+            if description:
+                part += f';desc="{description}"'
+            parts.append(part)
+        return ', '.join(parts)
+
+
+def activate(trace):
+    _local.trace = trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+def record(name, seconds):
+    # Cheap no-op unless something activated a trace on this thread.
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack at a fixed interval from a background thread.
+
+    Nothing is installed in the profiled threads, so the cost is the sampler's own wake-ups
+    and it can run against a live server. Stacks are counted root first, keyed by thread name.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}  # (thread name, frame names...) -> samples
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+
+    def _sample(self, skip):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            key = (names.get(ident, f'thread-{ident}'),) + tuple(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def run(self, seconds):
+        """Sample for `seconds` on the calling thread, then return self."""
+        me = threading.get_ident()
+        self.started = time.time()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self._sample(me)
+            time.sleep(self.interval)
+        self.stopped = time.time()
+        return self
+
+    def collapsed(self):
+        # Brendan Gregg's folded format, as read by flamegraph.pl and speedscope.
+        return ''.join(f"{';'.join(name.replace(';', ':') for name in stack)} {count}\n"
+                       for stack, count in sorted(self.stacks.items()))
+
+    def speedscope(self):
+        frames, frame_ids, threads = [], {}, {}
+        for stack, count in sorted(self.stacks.items()):
+            ids = []
+            for name in stack[1:]:
+                fid = frame_ids.get(name)
+                if fid is None:
+                    fid = frame_ids[name] = len(frames)
+                    frames.append({'name': name})
+                ids.append(fid)
+            samples, weights = threads.setdefault(stack[0], ([], []))
+            samples.append(ids)
+            weights.append(count * self.interval)
+        profiles = [{'type': 'sampled', 'name': thread, 'unit': 'seconds', 'startValue': 0,
+                     'endValue': sum(weights), 'samples': samples, 'weights': weights}
+                    for thread, (samples, weights) in sorted(threads.items())]
+        return json.dumps({'$schema': 'https://www.speedscope.app/file-format-schema.json',
+                           'shared': {'frames': frames}, 'profiles': profiles,
+                           'name': f'geofence profile {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started))}',
+                           'exporter': 'geofence profiling.py'})
@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+from collections import deque
+
+MAX_CHANGES = 4096  # changed keys remembered for ?since= requests
+
+
+def keyed_by(field):
+    return lambda items: {str(item.get(field)): item for item in items}
+
+
+class VersionedResource:
+    """Version counter, cached JSON body and per-record change log for one polled resource.
+
+    Stores hand out the same object until the underlying data changes, so refresh() only
+    diffs when it is given a new object, and bumps the version only when some record really
+    differs. Versions start from the wall clock in milliseconds, so they keep increasing
+    across restarts and a client's old version is never mistaken for a current one.
+    """
+
+    def __init__(self, name, records=dict, max_changes=MAX_CHANGES):
+        self.name = name
+        self.records = records
+        self.version = int(time.time() * 1000)
+        self._lock = threading.Lock()
+        self._data = None
+        self._current = {}
+        self._changes = deque(maxlen=max_changes)  # (version, key)
+        self._floor = self.version  # oldest version the change log can answer from
+        self._body = None
+
+    @property
+    def etag(self):
+        return f'{self.name}-{self.version}'
+
+    def refresh(self, data):
+        with self._lock:
+            if data is self._data:
+                return self.version
+            current = self.records(data)
+            changed = [k for k, v in current.items() if self._current.get(k, self) != v]
+            changed.extend(k for k in self._current if k not in current)
+            self._data = data
+            self._current = current
+            if changed:
+                self.version += 1
+                if len(self._changes) + len(changed) > self._changes.maxlen:
+                    self._floor = self.version - 1
+                    self._changes.clear()
+                self._changes.extend((self.version, k) for k in changed)
+            return self.version
+
+    def body(self, build, key=None):
+        # One encoding per version (or per caller-supplied key) no matter how many clients poll.
+        key = self.version if key is None else key
+        cached = self._body
+        if cached is None or cached[0] != key:
+            cached = (key, json.dumps(build()).encode())
+            self._body = cached
+        return cached[1]
+
+    def changes_since(self, since):
+        """Records changed after version `since`; `full` is set when the log no longer covers it."""
+        with self._lock:
+            current = self._current
+            if since < self._floor or since > self.version:
+                return {'version': self.version, 'full': True, 'changed': current, 'removed': []}
+            keys = {k for v, k in self._changes if v > since}
+        return {'version': self.version, 'full': False,
+                'changed': {k: current[k] for k in sorted(keys) if k in current},
+                'removed': sorted(k for k in keys if k not in current)}
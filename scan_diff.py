@@ -0,0 +1,84 @@
+EVENT_TYPES = ('appeared', 'vanished', 'zone', 'ip', 'trust', 'updated')
+
+
+def zone_set(device):
+    zones = device.get('zones')
+    if zones is None:
+        zones = [device['zone']] if device.get('inside') else []
+    return frozenset(zones)
+
+
+def diff_scans(previous, current):
+    """Typed events between two scan results, in one pass over each.
+
+    `appeared` and `vanished` carry the device as last seen. A device present in both
+    scans yields `trust`, `zone` and `ip` events for each of those that changed (zone
+    events list the zones `entered` and `exited`), or a single `updated` when only other
+    fields did. Trusted and unknown devices are treated alike.
+    """
+    before = {d['mac']: d for d in previous}
+    events = []
+    for new in current:
+        mac = new['mac']
+        old = before.pop(mac, None)
+        if old is None:
+            events.append({'type': 'appeared', 'mac': mac, 'device': new})
+            continue
+        if old is new or old == new:
+            continue
+        typed = False
+        if old.get('status') != new.get('status'):
+            events.append({'type': 'trust', 'mac': mac, 'device': new, 'from': old.get('status'), 'to': new.get('status')})
+            typed = True
+        old_zones, new_zones = zone_set(old), zone_set(new)
+        if old_zones != new_zones:
+            events.append({'type': 'zone', 'mac': mac, 'device': new, 'from': sorted(old_zones), 'to': sorted(new_zones),
+                           'entered': sorted(new_zones - old_zones), 'exited': sorted(old_zones - new_zones)})
+            typed = True
+        if old.get('ip') != new.get('ip'):
+            events.append({'type': 'ip', 'mac': mac, 'device': new, 'from': old.get('ip'), 'to': new.get('ip')})
+            typed = True
+        if not typed:
+            events.append({'type': 'updated', 'mac': mac, 'device': new})
+    # Whatever is left in `before` was not in this scan.
+    events.extend({'type': 'vanished', 'mac': mac, 'device': old} for mac, old in before.items())
+    return events
+
+
+class ScanDiffer:
+    """ScanEngine listener that diffs each scan against the previous one and hands the
+    events to its consumers.
+
+    A consumer is called as consumer(events) with the events of the types it subscribed
+    to, and only when there are some. Consumers subscribed with initial=False skip the
+    first scan, whose every device would otherwise count as appeared.
+    """
+
+    def __init__(self):
+        self.consumers = []  # (types or None for all, initial, consumer)
+        self.scans = 0
+
+    def subscribe(self, consumer, types=None, initial=True):
+        unknown = set(types or ()) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f'unknown event types {sorted(unknown)}')
+        self.consumers.append((frozenset(types) if types else None, initial, consumer))
+        return consumer
+
+    def __call__(self, previous, current):
+        first = self.scans == 0
+        self.scans += 1
+        events = diff_scans(previous, current)
+        if not events:
+            return events
+        for types, initial, consumer in self.consumers:
+            if first and not initial:
+                continue
+            wanted = events if types is None else [e for e in events if e['type'] in types]
+            if not wanted:
+                continue
+            try:
+                consumer(wanted)
+            except Exception as e:
+                print("Scan event consumer failed:", e)
+        return events
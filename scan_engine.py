@@ -0,0 +1,95 @@
+import threading
+import time
+from datetime import datetime
+
+import profiling
+
+SCAN_INTERVAL = 10  # seconds
+
+
+class ScanEngine:
+    """Runs a scan job on its own thread and keeps the latest result in memory."""
+
+    def __init__(self, job, interval=SCAN_INTERVAL):
+        self.job = job
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._snapshot = []
+        self._scanned_at = None
+        self._scan_count = 0
+        self._last_error = None
+        self._trace = None
+        self.listeners = []  # called as listener(previous, result) on the scan thread
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='scan-engine', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def scan_once(self):
+        # Phases the job times land in this trace, kept together with the result they produced.
+        trace = profiling.Trace()
+        profiling.activate(trace)
+        try:
+            result = self.job()
+        except Exception as e:
+            print("Scan failed:", e)
+            self._last_error = str(e)
+            self._ready.set()
+            return
+        finally:
+            profiling.activate(None)
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = result
+            self._trace = trace
+            self._scanned_at = datetime.now().isoformat()
+            self._scan_count += 1
+            self._last_error = None
+        for listener in self.listeners:
+            try:
+                listener(previous, result)
+            except Exception as e:
+                print("Scan listener failed:", e)
+        self._ready.set()
+
+    def trigger(self):
+        # Run the next scan now instead of waiting out the interval.
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.scan_once()
+            self._wake.wait(max(0.0, self.interval - (time.monotonic() - started)))
+            self._wake.clear()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def snapshot(self):
+        return self.traced_snapshot()[0]
+
+    def traced_snapshot(self):
+        # The job hands over a fresh list each cycle, so readers can share it as-is.
+        with self._lock:
+            return {
+                'devices': self._snapshot,
+                'scanned_at': self._scanned_at,
+                'scan_count': self._scan_count,
+                'error': self._last_error,
+            }, self._trace
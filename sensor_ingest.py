@@ -0,0 +1,110 @@
+import gzip
+import json
+import re
+import threading
+import time
+import zlib
+
+from neighbor_table import normalize_mac
+
+PROTOCOL_VERSION = 1
+STALE_MIN = 60  # seconds a sensor's observation stays valid at the least
+STALE_INTERVALS = 2.5  # ...or this many of its push intervals, whichever is longer
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAC_RE = re.compile(r'^[0-9a-f]{1,2}([:-][0-9a-f]{1,2}){5}$', re.I)
+SENSOR_RE = re.compile(r'^[\w.@-]{1,64}$')
+
+
+def encode_batch(sensor, rows, interval, seq=0):
+    """Agent side: a gzip'd compact JSON batch; rows are [ip, mac, iface, age_seconds]."""
+    doc = {'v': PROTOCOL_VERSION, 'sensor': sensor, 'seq': seq, 'interval': interval, 'devices': rows}
+    return gzip.compress(json.dumps(doc, separators=(',', ':')).encode(), compresslevel=6)
+
+
+def decode_batch(body, gzipped=True):
+    if gzipped:
+        inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = inflate.decompress(body, MAX_BATCH_BYTES)
+        if inflate.unconsumed_tail:
+            raise ValueError('batch too large')
+    doc = json.loads(body)
+    if not isinstance(doc, dict) or doc.get('v') != PROTOCOL_VERSION:
+        raise ValueError('unsupported batch version')
+    if not SENSOR_RE.match(str(doc.get('sensor', ''))):
+        raise ValueError('invalid sensor name')
+    if not isinstance(doc.get('devices'), list):
+        raise ValueError('devices must be a list')
+    return doc
+
+
+class SensorMerger:
+    """Latest observations from every remote sensor, merged with the local scan by MAC.
+
+    Ingesting a batch only updates one dict per sensor, so hundreds of sensors pushing
+    every few seconds cost a few dict writes each; the merge runs once per device scan.
+    Agents report how long ago they last saw each device rather than a timestamp, so
+    sensor clocks do not need to agree with ours.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sensors = {}
+
+    def ingest(self, doc, address=None, now=None):
+        now = time.time() if now is None else now
+        seen = {}
+        for row in doc['devices']:
+            try:
+                ip, mac, iface, age = row
+                age = max(0.0, float(age))
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(mac, str) or not MAC_RE.match(mac):
+                continue
+            mac = normalize_mac(mac)
+            last_seen = now - age
+            if mac not in seen or seen[mac][2] < last_seen:
+                seen[mac] = (str(ip), str(iface or ''), last_seen)
+        try:
+            interval = max(1.0, float(doc.get('interval') or 0))
+        except (TypeError, ValueError):
+            interval = 1.0
+        with self._lock:
+            sensor = self._sensors.setdefault(doc['sensor'], {'seen': {}})
+            sensor['seen'].update(seen)
+            sensor.update(contact=now, interval=interval, seq=doc.get('seq'), address=address,
+                          batches=sensor.get('batches', 0) + 1)
+        return len(seen)
+
+    def _stale_after(self, sensor):
+        return max(STALE_MIN, STALE_INTERVALS * sensor['interval'])
+
+    def merge(self, local, local_name='local', now=None):
+        """The local scan plus every fresh remote observation, one record per MAC."""
+        now = time.time() if now is None else now
+        merged = {d['mac']: (now, {**d, 'sensor': local_name, 'sensors': [local_name]}) for d in local}
+        with self._lock:
+            for name, sensor in self._sensors.items():
+                cutoff = now - self._stale_after(sensor)
+                seen = sensor['seen']
+                expired = [mac for mac, obs in seen.items() if obs[2] < cutoff]
+                for mac in expired:
+                    del seen[mac]
+                for mac, (ip, iface, last_seen) in seen.items():
+                    current = merged.get(mac)
+                    if current is None:
+                        merged[mac] = (last_seen, {'ip': ip, 'mac': mac, 'iface': iface, 'sensor': name, 'sensors': [name]})
+                        continue
+                    current[1]['sensors'].append(name)
+                    if last_seen > current[0]:
+                        # The freshest sighting decides the address; the device still counts once.
+                        merged[mac] = (last_seen, {**current[1], 'ip': ip, 'iface': iface, 'sensor': name})
+        return [record for _, record in merged.values()]
+
+    def sensors(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return {name: {'last_contact': s['contact'], 'age': round(now - s['contact'], 1),
+                           'stale': now - s['contact'] > self._stale_after(s), 'devices': len(s['seen']),
+                           'batches': s['batches'], 'seq': s['seq'], 'address': s['address']}
+                    for name, s in self._sensors.items()}
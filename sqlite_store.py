@@ -0,0 +1,371 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from journal import JournalMap
+from log_segments import SegmentStore
+from marker_index import sample_evenly
+from presence import StateWriteBehind
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS known_devices (mac TEXT PRIMARY KEY, label TEXT);
+CREATE TABLE IF NOT EXISTS zones (name TEXT PRIMARY KEY, type TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS last_seen (mac TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS locations (device TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS markers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    label TEXT,
+    lat REAL,
+    lon REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS markers_label ON markers (label);
+CREATE INDEX IF NOT EXISTS markers_position ON markers (lat, lon);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    mac TEXT,
+    zone TEXT,
+    event TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp);
+CREATE INDEX IF NOT EXISTS events_mac ON events (mac, timestamp);
+CREATE INDEX IF NOT EXISTS events_zone ON events (zone, timestamp);
+"""
+
+TABLES = ('known_devices', 'zones', 'last_seen', 'locations', 'markers')
+MIGRATED = 'json_import'  # meta row recording that the JSON files were imported
+
+
+class SQLiteStore:
+    """Optional backend: one SQLite database in WAL mode, so readers never block the scanner.
+
+    Each table has a version counter in `meta`; parsed views and derived structures are
+    cached per version, and every write bumps the version inside the same transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._views = {}
+        self._scan_state = StateWriteBehind()
+        # executescript() manages its own transaction, so the schema goes in before ours.
+        self._db().executescript(SCHEMA)
+        with self._transaction() as db:
+            db.executemany('INSERT OR IGNORE INTO meta (key, version) VALUES (?, 0)', [(t,) for t in TABLES])
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    class _Transaction:
+        def __init__(self, db):
+            self.db = db
+
+        def __enter__(self):
+            self.db.execute('BEGIN IMMEDIATE')
+            return self.db
+
+        def __exit__(self, exc_type, exc, tb):
+            self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+            return False
+
+    def _transaction(self):
+        return self._Transaction(self._db())
+
+    @staticmethod
+    def _bump(db, *tables):
+        db.executemany('UPDATE meta SET version = version + 1 WHERE key = ?', [(t,) for t in tables])
+
+    def _version(self, table):
+        return self._db().execute('SELECT version FROM meta WHERE key = ?', (table,)).fetchone()[0]
+
+    def _view(self, table, name, builder):
+        version = self._version(table)
+        cached = self._views.get((table, name))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = builder()
+        with self._lock:
+            self._views[(table, name)] = (version, value)
+        return value
+
+    # Known devices
+    def known_devices(self):
+        return self._view('known_devices', 'all', lambda: dict(
+            self._db().execute('SELECT mac, label FROM known_devices ORDER BY mac')))
+
+    def trusted_macs(self):
+        return self._view('known_devices', 'macs', lambda: frozenset(
+            row[0] for row in self._db().execute('SELECT mac FROM known_devices')))
+
+    def set_trusted(self, mac, label):
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO known_devices (mac, label) VALUES (?, ?)', (mac, label))
+            self._bump(db, 'known_devices')
+
+    def remove_trusted(self, mac):
+        with self._transaction() as db:
+            db.execute('DELETE FROM known_devices WHERE mac = ?', (mac,))
+            self._bump(db, 'known_devices')
+
+    # Zones
+    def zones(self):
+        return self._view('zones', 'all', lambda: {
+            name: json.loads(data) for name, data in self._db().execute('SELECT name, data FROM zones ORDER BY rowid')})
+
+    def derive_zones(self, name, builder):
+        return self._view('zones', name, lambda: builder(self.zones()))
+
+    def save_zone(self, name, zone):
+        with self._transaction() as db:
+            db.execute('INSERT INTO zones (name, type, data) VALUES (?, ?, ?) '
+                       'ON CONFLICT(name) DO UPDATE SET type = excluded.type, data = excluded.data',
+                       (name, zone.get('type'), json.dumps(zone)))
+            self._bump(db, 'zones')
+
+    # Last-seen state and events
+    def _persisted_last_seen(self):
+        return self._view('last_seen', 'all', lambda: {
+            mac: json.loads(data) for mac, data in self._db().execute('SELECT mac, data FROM last_seen')})
+
+    def last_seen(self):
+        persisted = self._persisted_last_seen()
+        return self._scan_state.current(persisted, self._version('last_seen'))
+
+    def save_scan(self, last_seen, events=(), flush=False):
+        # One transaction per scan: the changed rows and the events land together or not at all.
+        # Per-scan last_seen/ip refreshes stay in memory between flushes; see StateWriteBehind.
+        with self._transaction() as db:
+            previous = self._persisted_last_seen()
+            changes, deletes = self._scan_state.changes(previous, last_seen, flush)
+            db.executemany('INSERT INTO last_seen (mac, data) VALUES (?, ?) '
+                           'ON CONFLICT(mac) DO UPDATE SET data = excluded.data',
+                           [(mac, json.dumps(state)) for mac, state in changes.items()])
+            db.executemany('DELETE FROM last_seen WHERE mac = ?', [(mac,) for mac in deletes])
+            self._insert_events(db, events)
+            if changes or deletes:
+                self._bump(db, 'last_seen')
+            version = self._version('last_seen')
+        if changes or deletes:
+            # Patch the cached view to what the table now holds rather than re-reading it.
+            persisted = {**previous, **changes}
+            for mac in deletes:
+                del persisted[mac]
+            with self._lock:
+                self._views[('last_seen', 'all')] = (version, persisted)
+        self._scan_state.keep(last_seen, version)
+
+    # GPS locations
+    def locations(self):
+        return self._view('locations', 'all', lambda: {
+            device: json.loads(data) for device, data in self._db().execute('SELECT device, data FROM locations')})
+
+    def save_locations(self, changes):
+        if not changes:
+            return
+        with self._transaction() as db:
+            db.executemany('INSERT INTO locations (device, data) VALUES (?, ?) '
+                           'ON CONFLICT(device) DO UPDATE SET data = excluded.data',
+                           [(device, json.dumps(state)) for device, state in changes.items()])
+            self._bump(db, 'locations')
+
+    @staticmethod
+    def _insert_events(db, events):
+        db.executemany('INSERT INTO events (timestamp, mac, zone, event, data) VALUES (?, ?, ?, ?, ?)',
+                       [(e.get('timestamp'), e.get('mac') or e.get('device_id'), e.get('zone'), e.get('event'),
+                         json.dumps(e)) for e in events])
+
+    def append_events(self, events):
+        if not events:
+            return
+        with self._transaction() as db:
+            self._insert_events(db, events)
+
+    def events(self):
+        return [json.loads(data) for (data,) in self._db().execute('SELECT data FROM events ORDER BY id')]
+
+    def query_events(self, since=None, until=None, mac=None, zone=None, cursor=None, limit=100, descending=True):
+        # Keyset pagination on (timestamp, id); the cursor is the last row returned.
+        where, args = [], []
+        for column, op, value in (('timestamp', '>=', since), ('timestamp', '<=', until), ('mac', '=', mac), ('zone', '=', zone)):
+            if value is not None:
+                where.append(f'{column} {op} ?')
+                args.append(value)
+        if cursor:
+            ts, _, row_id = cursor.rpartition('|')
+            where.append(f"(timestamp, id) {'<' if descending else '>'} (?, ?)")
+            args += [ts, int(row_id)]
+        order = 'DESC' if descending else 'ASC'
+        rows = self._db().execute(
+            f"SELECT id, timestamp, data FROM events {'WHERE ' + ' AND '.join(where) if where else ''} "
+            f"ORDER BY timestamp {order}, id {order} LIMIT ?", args + [limit + 1]).fetchall()
+        next_cursor = f'{rows[limit - 1][1]}|{rows[limit - 1][0]}' if len(rows) > limit else None
+        return [json.loads(data) for _, _, data in rows[:limit]], next_cursor
+
+    def tail_events(self, after, limit=100):
+        rows = self._db().execute('SELECT id, data FROM events WHERE id > ? ORDER BY id LIMIT ?',
+                                  (int(after or 0), limit)).fetchall()
+        return [json.loads(data) for _, data in rows], (rows[-1][0] if rows else int(after or 0))
+
+    # Markers
+    @staticmethod
+    def _marker(row):
+        return {**json.loads(row[1]), 'id': str(row[0])}
+
+    def markers(self):
+        return self._view('markers', 'all', lambda: [
+            self._marker(row) for row in self._db().execute('SELECT id, data FROM markers ORDER BY id')])
+
+    def markers_in_bbox(self, south, west, north, east, limit=None):
+        # Served by the (lat, lon) index; a box across the antimeridian has west > east.
+        lon_clause = 'lon BETWEEN ? AND ?' if west <= east else '(lon >= ? OR lon <= ?)'
+        where = f'lat BETWEEN ? AND ? AND {lon_clause}'
+        params = (south, north, west, east)
+        db = self._db()
+        total = db.execute(f'SELECT COUNT(*) FROM markers WHERE {where}', params).fetchone()[0]
+        if limit is None or total <= limit:
+            rows = db.execute(f'SELECT id, data FROM markers WHERE {where} ORDER BY id', params)
+            return [self._marker(row) for row in rows], total
+        # Too many: sample across the viewport as the JSON store's grid does, then load only those.
+        points = db.execute(f'SELECT id, lat, lon FROM markers WHERE {where} ORDER BY id', params).fetchall()
+        ids = sample_evenly(points, limit)
+        found = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            found.update((row[0], row) for row in db.execute(
+                f"SELECT id, data FROM markers WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        return [self._marker(found[i]) for i in ids if i in found], total
+
+    def add_markers(self, markers):
+        ids = []
+        with self._transaction() as db:
+            for marker in markers:
+                marker = {k: v for k, v in marker.items() if k != 'id'}
+                cur = db.execute('INSERT INTO markers (label, lat, lon, data) VALUES (?, ?, ?, ?)',
+                                 (marker.get('label'), marker.get('lat'), marker.get('lon'), json.dumps(marker)))
+                ids.append(str(cur.lastrowid))
+            if ids:
+                self._bump(db, 'markers')
+        return ids
+
+    def add_marker(self, marker):
+        return self.add_markers([marker])[0]
+
+    def update_markers(self, updates):
+        updated = []
+        changed = False
+        with self._transaction() as db:
+            for update in updates:
+                row = db.execute('SELECT id, data FROM markers WHERE id = ?', (update.get('id'),)).fetchone()
+                if row is None:
+                    continue
+                updated.append(str(row[0]))
+                current = json.loads(row[1])
+                marker = {**current, **{k: v for k, v in update.items() if k != 'id'}}
+                if marker == current:
+                    continue
+                changed = True
+                db.execute('UPDATE markers SET label = ?, lat = ?, lon = ?, data = ? WHERE id = ?',
+                           (marker.get('label'), marker.get('lat'), marker.get('lon'), json.dumps(marker), row[0]))
+            # Unchanged markers leave the version, and so every client's ETag, alone.
+            if changed:
+                self._bump(db, 'markers')
+        return updated
+
+    def delete_markers(self, ids):
+        deleted = []
+        with self._transaction() as db:
+            for marker_id in dict.fromkeys(ids):
+                if db.execute('DELETE FROM markers WHERE id = ?', (marker_id,)).rowcount:
+                    deleted.append(str(marker_id))
+            if deleted:
+                self._bump(db, 'markers')
+        return deleted
+
+    def move_marker(self, label, lat, lon):
+        row = self._db().execute('SELECT id FROM markers WHERE label = ? ORDER BY id LIMIT 1', (label,)).fetchone()
+        return row is not None and bool(self.update_markers([{'id': row[0], 'lat': lat, 'lon': lon}]))
+
+    def clear_markers(self):
+        with self._transaction() as db:
+            if db.execute('DELETE FROM markers').rowcount:
+                self._bump(db, 'markers')
+
+    # Migration
+    def import_json(self, known_devices, zones, last_seen, markers, events, locations=None):
+        """Load the JSON backend's state once; returns False if an earlier import already did."""
+        with self._transaction() as db:
+            if db.execute('SELECT 1 FROM meta WHERE key = ?', (MIGRATED,)).fetchone():
+                return False
+            db.executemany('INSERT OR REPLACE INTO known_devices (mac, label) VALUES (?, ?)', known_devices.items())
+            db.executemany('INSERT OR REPLACE INTO zones (name, type, data) VALUES (?, ?, ?)',
+                           [(name, z.get('type'), json.dumps(z)) for name, z in zones.items()])
+            db.executemany('INSERT OR REPLACE INTO last_seen (mac, data) VALUES (?, ?)',
+                           [(mac, json.dumps(state)) for mac, state in last_seen.items()])
+            db.executemany('INSERT OR REPLACE INTO locations (device, data) VALUES (?, ?)',
+                           [(device, json.dumps(state)) for device, state in (locations or {}).items()])
+            db.executemany('INSERT INTO markers (label, lat, lon, data) VALUES (?, ?, ?, ?)',
+                           [(m.get('label'), m.get('lat'), m.get('lon'),
+                             json.dumps({k: v for k, v in m.items() if k != 'id'})) for m in markers])
+            self._insert_events(db, events)
+            self._bump(db, *TABLES)
+            db.execute('INSERT INTO meta (key, version) VALUES (?, 1)', (MIGRATED,))
+        return True
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:
+        print(f"Warning: {path} is empty or corrupted. Skipping it.")
+        return default
+
+
+def read_json_files(known_devices_file='known_devices.json', zones_file='zones.json', last_seen_file='last_seen.json',
+                    markers_file='markers.json', log_file='device_log.txt', last_location_file='last_location.json'):
+    """The JSON backend's state, read straight from its files without rewriting any of them."""
+    markers = read_json(markers_file, [])
+    if isinstance(markers, dict):
+        markers = list(JournalMap(markers_file, compact_every=None).data().values())
+    events = []
+    for segment in SegmentStore(log_file).segments():
+        events.extend(json.loads(line) for line in segment.lines() if line.strip())
+    if os.path.exists(log_file):
+        with open(log_file) as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+    return {'known_devices': JournalMap(known_devices_file, compact_every=None).data(),
+            'zones': read_json(zones_file, {}),
+            'last_seen': JournalMap(last_seen_file, compact_every=None).data(),
+            'locations': JournalMap(last_location_file, compact_every=None).data(),
+            'markers': markers, 'events': events}
+
+
+def migrate_from_json(db_path, state):
+    """Import `state` (see read_json_files) into db_path; None if it was imported before."""
+    if not SQLiteStore(db_path).import_json(**state):
+        return None
+    return {kind: len(items) for kind, items in state.items()}
+
+
+if __name__ == '__main__':
+    # One-shot migration, run from the directory holding the JSON files: python sqlite_store.py [geofence.db]
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('GEOFENCE_DB', 'geofence.db')
+    counts = migrate_from_json(db_path, read_json_files())
+    if counts is None:
+        print(f"{db_path} already holds the imported JSON data; nothing to do.")
+    else:
+        print('Migrated', ', '.join(f'{n} {k}' for k, n in counts.items()), 'into', db_path)
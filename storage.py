@@ -0,0 +1,287 @@
+import copy
+import json
+import os
+import threading
+import time
+
+from config_cache import write_json_atomic
+from journal import JournalMap
+from log_index import LogIndex, decode_tail, encode_tail, event_time, query_time
+from log_segments import SegmentStore, segment_page
+from marker_index import MarkerGrid, new_marker_id
+from presence import StateWriteBehind
+
+LOG_MAX_BYTES = 4 * 1024 * 1024
+LOG_MAX_AGE = 24 * 3600  # seconds
+LOG_MAX_SEGMENTS = 50
+
+
+class JSONStore:
+    """Default backend: one pretty-printed JSON file per kind of state plus a JSONL event log.
+
+    Known devices, last-seen state, GPS locations and markers (keyed by ID) change a few entries at a time,
+    so they are kept as JournalMaps: each change appends a delta to `<file>.journal` and the JSON file itself
+    is rewritten only on compaction.
+    """
+
+    def __init__(self, cache, known_devices_file, zones_file, last_seen_file, last_location_file, markers_file, log_file,
+                 log_max_bytes=LOG_MAX_BYTES, log_max_age=LOG_MAX_AGE, log_max_segments=LOG_MAX_SEGMENTS):
+        self.cache = cache
+        self.known_devices_file = known_devices_file
+        self.zones_file = zones_file
+        self.last_seen_file = last_seen_file
+        self.last_location_file = last_location_file
+        self.markers_file = markers_file
+        self.log_file = log_file
+        self._lock = threading.Lock()
+        self._known = JournalMap(known_devices_file)
+        self._last_seen = JournalMap(last_seen_file)
+        self._scan_state = StateWriteBehind()
+        self._locations = JournalMap(last_location_file)
+        self._markers = JournalMap(self._upgrade_markers(markers_file))
+        self._derived = {}
+        self._log_index = None
+        self._log_lock = threading.Lock()
+        self._log_started = None
+        self.log_max_bytes = log_max_bytes
+        self.log_max_age = log_max_age
+        self.segments = SegmentStore(log_file, max_segments=log_max_segments)
+        self.segments.recover()
+
+    def _update(self, path, change, default=dict):
+        # Read-modify-write on a private copy so readers of the cached object never see a partial change.
+        with self._lock:
+            data = copy.deepcopy(self.cache.load(path)) or default()
+            result = change(data)
+            self.cache.store(path, data)
+            return result
+
+    def _derive(self, name, journal, build):
+        # Built from a snapshot and kept until the journal's version moves on.
+        journal.data()
+        cached = self._derived.get(name)
+        if cached is None or cached[0] != journal.version:
+            version, data = journal.snapshot()
+            cached = self._derived[name] = (version, build(data))
+        return cached[1]
+
+    # Known devices
+    def known_devices(self):
+        return self._derive('known', self._known, dict)
+
+    def trusted_macs(self):
+        return self._derive('macs', self._known, frozenset)
+
+    def set_trusted(self, mac, label):
+        self._known.set(mac, label)
+
+    def remove_trusted(self, mac):
+        self._known.delete(mac)
+
+    # Zones
+    def zones(self):
+        return self.cache.load(self.zones_file)
+
+    def derive_zones(self, name, builder):
+        return self.cache.derive(self.zones_file, name, builder)
+
+    def save_zone(self, name, zone):
+        self._update(self.zones_file, lambda zones: zones.__setitem__(name, zone))
+
+    # Last-seen state and events
+    def last_seen(self):
+        persisted = self._last_seen.data()
+        return self._scan_state.current(persisted, self._last_seen.version)
+
+    def save_scan(self, last_seen, events=(), flush=False):
+        # Per-scan last_seen/ip refreshes stay in memory between flushes; see StateWriteBehind.
+        self._last_seen.update(*self._scan_state.changes(self._last_seen.data(), last_seen, flush))
+        self._scan_state.keep(last_seen, self._last_seen.version)
+        self.append_events(events)
+
+    # GPS locations
+    def locations(self):
+        return self._locations.data()
+
+    def save_locations(self, changes):
+        # One journal record for the devices this report moved, however many are tracked.
+        self._locations.update(changes)
+
+    def append_events(self, events):
+        if not events:
+            return
+        with self._log_lock:
+            with open(self.log_file, 'a') as f:
+                if f.tell() == 0:
+                    self._log_started = time.time()
+                f.write(''.join(json.dumps(e) + '\n' for e in events))
+                size = f.tell()
+            if self._log_started is None:
+                # A log left over from a previous run: date it by its first record.
+                self._log_started = min(self._first_event_time(), time.time())
+            if size >= self.log_max_bytes or time.time() - self._log_started >= self.log_max_age:
+                self.rotate_log()
+
+    def _first_event_time(self):
+        try:
+            with open(self.log_file) as f:
+                return event_time(json.loads(f.readline()).get('timestamp')) or time.time()
+        except (OSError, ValueError, AttributeError):
+            return time.time()
+
+    def rotate_log(self):
+        # Callers appending in this process hold _log_lock, so nothing lands in the renamed file.
+        segment = self.segments.rotate()
+        self.log_index().reset()
+        self._log_started = None
+        return segment
+
+    def events(self):
+        result = []
+        for segment in self.segments.segments():
+            try:
+                result.extend(json.loads(line) for line in segment.lines() if line.strip())
+            except FileNotFoundError:
+                continue  # pruned by a concurrent rotation
+        if os.path.exists(self.log_file):
+            with open(self.log_file) as f:
+                result.extend(json.loads(line) for line in f if line.strip())
+        return result
+
+    def log_index(self):
+        if self._log_index is None:
+            self._log_index = LogIndex(self.log_file)
+        return self._log_index
+
+    def query_events(self, since=None, until=None, mac=None, zone=None, cursor=None, limit=100, descending=True):
+        """Page through the active log and then the rotated segments (reverse for ascending order).
+
+        Cursors look like `<source>@<position>`, where source is `active` or a segment number.
+        Segments whose header rules out the filters are skipped without being decompressed.
+        """
+        # Log records with bad timestamps sort as 0.0, but a bad bound is the caller's error.
+        since = None if since is None else event_time(query_time(since))
+        until = None if until is None else event_time(query_time(until))
+        segments = self.segments.segments()
+        sources = ['active'] + segments[::-1] if descending else segments + ['active']
+        start, position = 0, None
+        if cursor:
+            name, _, position = cursor.rpartition('@')
+            name = name or 'active'
+            position = position or None
+            if name != 'active':
+                seq = int(name)
+                # An expired segment resumes at the next one that still exists.
+                start = next((k for k, src in enumerate(sources) if src != 'active' and
+                              (src.seq <= seq if descending else src.seq >= seq)), len(sources))
+                if start < len(sources) and sources[start].seq != seq:
+                    position = None
+            else:
+                start = sources.index('active')
+        events = []
+        for k in range(start, len(sources)):
+            source = sources[k]
+            remaining = limit - len(events)
+            if source == 'active':
+                page, inner = self.log_index().query(since, until, mac, zone, position, remaining, descending)
+                events.extend(page)
+                if inner:
+                    return events, f'active@{inner}'
+            elif source.may_match(since, until, mac, zone):
+                try:
+                    page, line = segment_page(source, since, until, mac, zone,
+                                              None if position is None else int(position), remaining, descending)
+                except FileNotFoundError:
+                    page, line = [], None  # pruned by a rotation since the listing; its records are gone
+                events.extend(page)
+                if line is not None:
+                    return events, f'{source.seq}@{line}'
+            position = None
+            if len(events) >= limit and k + 1 < len(sources):
+                following = sources[k + 1]
+                return events, f"{'active' if following == 'active' else following.seq}@"
+        return events, None
+
+    def tail_events(self, after, limit=100):
+        # The cursor names the active log's generation: a byte offset means nothing in another file.
+        generation, offset = decode_tail(after)
+        with self._log_lock:
+            current = self.segments.generation()
+            if generation is not None and generation > current:
+                raise ValueError(f'tail cursor {after!r} is from the future')
+            if generation != current:
+                offset = 0  # rotated since the last poll; resume at the top of the new file
+            events, offset = self.log_index().tail(offset, limit)
+        return events, encode_tail(current, offset)
+
+    # Markers
+    @staticmethod
+    def _upgrade_markers(path):
+        # markers.json used to be a plain list; key it by generated IDs once.
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except ValueError:
+                data = None
+            if isinstance(data, list) and data:
+                write_json_atomic(path, {m['id']: m for m in ({**m, 'id': new_marker_id()} for m in data)})
+        return path
+
+    def markers(self):
+        return self._derive('markers', self._markers, lambda data: list(data.values()))
+
+    def _marker_grid(self):
+        return self._derive('marker_grid', self._markers, lambda data: MarkerGrid(data.values()))
+
+    def _write_markers(self, changes=None, deletes=()):
+        with self._lock:
+            self._markers.data()
+            before = self._markers.version
+            self._markers.update(changes, deletes)
+            # Keep an existing grid in step with the change instead of rebuilding it.
+            cached = self._derived.get('marker_grid')
+            if cached is not None and cached[0] == before:
+                grid = cached[1]
+                for marker_id in deletes:
+                    grid.remove(marker_id)
+                for marker in (changes or {}).values():
+                    grid.add(marker)
+                self._derived['marker_grid'] = (self._markers.version, grid)
+
+    def markers_in_bbox(self, south, west, north, east, limit=None):
+        data = self._markers.data()
+        ids, total = self._marker_grid().query(south, west, north, east, limit)
+        return [data[i] for i in ids if i in data], total
+
+    def add_markers(self, markers):
+        created = {}
+        for marker in markers:
+            marker_id = new_marker_id()
+            created[marker_id] = {**marker, 'id': marker_id}
+        self._write_markers(created)
+        return list(created)
+
+    def add_marker(self, marker):
+        return self.add_markers([marker])[0]
+
+    def update_markers(self, updates):
+        current = self._markers.data()
+        changes = {u['id']: {**current[u['id']], **u} for u in updates if u.get('id') in current}
+        self._write_markers(changes)
+        return list(changes)
+
+    def delete_markers(self, ids):
+        current = self._markers.data()
+        deletes = [i for i in dict.fromkeys(ids) if i in current]
+        self._write_markers(deletes=deletes)
+        return deletes
+
+    def move_marker(self, label, lat, lon):
+        marker = next((m for m in self.markers() if m.get('label') == label), None)
+        if marker is None:
+            return False
+        return bool(self.update_markers([{'id': marker['id'], 'lat': lat, 'lon': lon}]))
+
+    def clear_markers(self):
+        self._write_markers(deletes=[m['id'] for m in self.markers()])
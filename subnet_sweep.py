@@ -0,0 +1,174 @@
+import asyncio
+import socket
+import time
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+from zone_index import IPV4, IPZoneIndex, zone_bounds
+
+SWEEP_CONCURRENCY = 256
+PROBE_TIMEOUT = 0.5  # seconds per address
+MAX_SWEEP_HOSTS = 4096  # addresses probed per sweep (a /20)
+ARP_SETTLE = 1.0  # seconds for the kernel to finish resolving probed addresses
+TCP_PORTS = (80, 443, 22)
+MAX_OPEN_SOCKETS = 256  # TCP connects in flight across all probes
+
+
+def socket_budget(limit=MAX_OPEN_SOCKETS):
+    # Leave at least half the process's file descriptors to the web server and state files.
+    if resource is None:
+        return limit
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return limit if soft == resource.RLIM_INFINITY else max(1, min(limit, soft // 2))
+
+
+def is_cidr_zone(zone):
+    return zone.get('cidr') is not None or '/' in str(zone.get('start', ''))
+
+
+def int_to_ip(value):
+    return socket.inet_ntop(socket.AF_INET, IPV4.pack(value))
+
+
+def sweep_addresses(zones, max_hosts=MAX_SWEEP_HOSTS):
+    """Host addresses covered by the ip_range/cidr zones, overlaps merged, at most `max_hosts`."""
+    ranges = []
+    for name, zone in zones.items():
+        if zone.get('type') not in IPZoneIndex.ZONE_TYPES:
+            continue
+        try:
+            lo, hi = zone_bounds(zone)
+        except (ValueError, TypeError):
+            continue
+        # Only a real network has network and broadcast addresses; /31 and /32 are all hosts.
+        if is_cidr_zone(zone) and hi - lo >= 3:
+            lo, hi = lo + 1, hi - 1
+        ranges.append((lo, hi))
+    addresses = []
+    end = -1
+    for lo, hi in sorted(ranges):
+        lo = max(lo, end + 1)
+        if lo > hi:
+            continue
+        take = min(hi - lo + 1, max_hosts - len(addresses))
+        addresses.extend(int_to_ip(v) for v in range(lo, lo + take))
+        end = hi
+        if len(addresses) >= max_hosts:
+            print(f"Warning: subnet sweep capped at {max_hosts} addresses.")
+            break
+    return addresses
+
+
+class UDPProber:
+    """Sends one empty datagram per address. The probe itself is the kernel's ARP request for
+    it: hosts that answer land in the neighbor table, where the normal scan picks them up.
+    Liveness is not known here, so probe() returns None."""
+
+    def __init__(self, port=9):
+        self.port = port
+        self._sock = None
+
+    async def probe(self, address):
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+        try:
+            self._sock.sendto(b'', (address, self.port))
+        except OSError:
+            pass  # e.g. no route, or the send buffer is full; the next sweep tries again
+        return None
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class TCPProber:
+    """Connects to a few common ports; an accepted or refused connection means the host is up.
+
+    Every probe tries all its ports at once, so at most `max_sockets` connects are in flight
+    across probes, whatever the sweep's concurrency, to stay clear of the fd limit.
+    """
+
+    def __init__(self, ports=TCP_PORTS, timeout=PROBE_TIMEOUT, max_sockets=None):
+        self.ports = ports
+        self.timeout = timeout
+        self.max_sockets = socket_budget() if max_sockets is None else max_sockets
+        self._slots = None
+        self._loop = None
+
+    def _sockets(self):
+        # Each sweep runs its own event loop, and a semaphore belongs to one loop.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._slots = loop, asyncio.Semaphore(self.max_sockets)
+        return self._slots
+
+    async def _connect(self, address, port):
+        async with self._sockets():
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), self.timeout)
+            except ConnectionRefusedError:
+                return True
+            except (OSError, asyncio.TimeoutError):
+                return False
+            writer.close()
+            await writer.wait_closed()
+            return True
+
+    async def probe(self, address):
+        # All ports at once, so a silent host costs one timeout rather than one per port.
+        return any(await asyncio.gather(*(self._connect(address, port) for port in self.ports)))
+
+    def close(self):
+        self._slots = self._loop = None
+
+
+PROBERS = {'udp': UDPProber, 'tcp': TCPProber}
+
+
+def sweep(addresses, prober, concurrency=SWEEP_CONCURRENCY, timeout=PROBE_TIMEOUT * 2):
+    """Probe `addresses` with at most `concurrency` probes in flight; return the ones found up."""
+
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(address):
+            async with slots:
+                try:
+                    return address, await asyncio.wait_for(prober.probe(address), timeout)
+                except (OSError, asyncio.TimeoutError):
+                    return address, False
+
+        return await asyncio.gather(*(one(a) for a in addresses))
+
+    try:
+        return [address for address, up in asyncio.run(run()) if up]
+    finally:
+        close = getattr(prober, 'close', None)
+        if close is not None:
+            close()
+
+
+class SubnetSweeper:
+    """Sweep job for a ScanEngine: probes every address in the IP zones, then lets ARP settle."""
+
+    def __init__(self, load_zones, prober, concurrency=SWEEP_CONCURRENCY, max_hosts=MAX_SWEEP_HOSTS,
+                 settle=ARP_SETTLE):
+        self.load_zones = load_zones
+        self.prober = prober
+        self.concurrency = concurrency
+        self.max_hosts = max_hosts
+        self.settle = settle
+
+    def __call__(self):
+        addresses = sweep_addresses(self.load_zones(), self.max_hosts)
+        started = time.monotonic()
+        up = sweep(addresses, self.prober, self.concurrency) if addresses else []
+        if addresses and self.settle:
+            time.sleep(self.settle)
+        return {'probed': len(addresses), 'up': up, 'seconds': round(time.monotonic() - started, 3)}
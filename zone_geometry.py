@@ -0,0 +1,185 @@
+import json
+import math
+import threading
+from array import array
+
+from gps_index import Polygon
+
+EARTH_RADIUS = 6371008.8  # metres
+SIMPLIFY_TOLERANCES = (0.00001, 0.0001, 0.001, 0.01)  # degrees; about 1 m, 10 m, 100 m, 1 km
+MIN_AREA = 1e-12  # square degrees; anything smaller is a degenerate ring
+
+
+def ring_from_coords(coords):
+    """Validate a zone's coords into an open ring of (lon, lat) points; raises ValueError."""
+    if not isinstance(coords, list):
+        raise ValueError('coords must be a list of points')
+    points = []
+    for c in coords:
+        try:
+            lat, lon = (c['lat'], c['lon']) if isinstance(c, dict) else (c[0], c[1])
+            lat, lon = float(lat), float(lon)
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise ValueError(f'invalid point {c!r}') from None
+        if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f'point out of range {c!r}')
+        if not points or points[-1] != (lon, lat):
+            points.append((lon, lat))
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if len(points) < 3:
+        raise ValueError('a zone needs at least 3 distinct points')
+    return points
+
+
+def signed_area(xs, ys):
+    n = len(xs)
+    return sum(xs[i - 1] * ys[i] - xs[i] * ys[i - 1] for i in range(n)) / 2.0
+
+
+def centroid(xs, ys, area):
+    n = len(xs)
+    cx = cy = 0.0
+    for i in range(n):
+        cross = xs[i - 1] * ys[i] - xs[i] * ys[i - 1]
+        cx += (xs[i - 1] + xs[i]) * cross
+        cy += (ys[i - 1] + ys[i]) * cross
+    return cx / (6 * area), cy / (6 * area)
+
+
+def simplify(xs, ys, tolerance):
+    """Douglas-Peucker on a closed ring, anchored at the first vertex and the one farthest from it."""
+    n = len(xs)
+    far = max(range(n), key=lambda i: (xs[i] - xs[0]) ** 2 + (ys[i] - ys[0]) ** 2)
+    keep = bytearray(n)
+    keep[0] = keep[far] = 1
+    stack = [(0, far), (far, n)]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = xs[a], ys[a]
+        bx, by = xs[b % n], ys[b % n]
+        dx, dy = bx - ax, by - ay
+        norm = math.hypot(dx, dy)
+        best, split = tolerance, None
+        for i in range(a + 1, b):
+            if norm:
+                d = abs(dy * (xs[i] - ax) - dx * (ys[i] - ay)) / norm
+            else:
+                d = math.hypot(xs[i] - ax, ys[i] - ay)
+            if d > best:
+                best, split = d, i
+        if split is not None:
+            keep[split] = 1
+            stack.append((a, split))
+            stack.append((split, b))
+    kept = [i for i in range(n) if keep[i]]
+    return array('d', (xs[i] for i in kept)), array('d', (ys[i] for i in kept))
+
+
+class ZoneGeometry:
+    """Everything derived from one gps zone's coords, computed once when the zone is saved.
+
+    The ring is validated and packed into float arrays (x = lon, y = lat, not closed), with
+    its bbox, a Polygon prepared for containment tests, its area in square metres and its
+    centroid, and Douglas-Peucker simplifications for each of SIMPLIFY_TOLERANCES.
+    """
+
+    __slots__ = ('name', 'xs', 'ys', 'bbox', 'area', 'centroid', 'prepared', 'simplified')
+
+    def __init__(self, name, coords):
+        points = ring_from_coords(coords)
+        self.name = name
+        self.xs = array('d', (p[0] for p in points))
+        self.ys = array('d', (p[1] for p in points))
+        self.bbox = (min(self.xs), min(self.ys), max(self.xs), max(self.ys))
+        planar = signed_area(self.xs, self.ys)
+        if abs(planar) < MIN_AREA:
+            raise ValueError('zone has no area')
+        lon, lat = centroid(self.xs, self.ys, planar)
+        self.centroid = (lat, lon)
+        # Equirectangular projection about the centroid; accurate for zone-sized polygons.
+        self.area = abs(planar) * math.radians(1) ** 2 * EARTH_RADIUS ** 2 * math.cos(math.radians(lat))
+        self.prepared = Polygon(name, self.xs, self.ys, self.bbox)
+        self.simplified = {}
+        xs, ys = self.xs, self.ys
+        for tolerance in SIMPLIFY_TOLERANCES:
+            sx, sy = simplify(xs, ys, tolerance)
+            if len(sx) < 3:
+                break  # coarser levels would collapse too; callers fall back to the finest kept
+            self.simplified[tolerance] = (sx, sy)
+            xs, ys = sx, sy
+
+    def ring(self, tolerance=0.0):
+        """[[lat, lon], ...] at the coarsest precomputed tolerance not above `tolerance`."""
+        xs, ys = self.xs, self.ys
+        for level in SIMPLIFY_TOLERANCES:
+            if level > tolerance or level not in self.simplified:
+                break
+            xs, ys = self.simplified[level]
+        return [[y, x] for x, y in zip(xs, ys)]
+
+    def to_json(self, tolerance=0.0):
+        minx, miny, maxx, maxy = self.bbox
+        return {'ring': self.ring(tolerance), 'bbox': [miny, minx, maxy, maxx],
+                'area': round(self.area, 1), 'centroid': list(self.centroid)}
+
+
+class ZoneGeometries:
+    """ZoneGeometry for every gps zone, with encoded map payloads memoized per tolerance."""
+
+    def __init__(self, geometries):
+        self.geometries = geometries
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        return self.geometries[name]
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def polygons(self):
+        return [g.prepared for g in self.geometries.values()]
+
+    def payload(self, tolerance=0.0):
+        # One encoding per precomputed level, shared by every map that asks for it.
+        level = max((t for t in SIMPLIFY_TOLERANCES if t <= tolerance), default=0.0)
+        body = self._payloads.get(level)
+        if body is None:
+            with self._lock:
+                body = self._payloads.get(level)
+                if body is None:
+                    body = json.dumps({name: g.to_json(level) for name, g in self.geometries.items()}).encode()
+                    self._payloads[level] = body
+        return level, body
+
+
+class GeometryCache:
+    """Builds ZoneGeometries for a zones dict, reusing the geometry of zones whose coords did not change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}  # name -> (coords, ZoneGeometry)
+
+    def prime(self, name, coords, geometry):
+        # A save that already validated the zone hands over its geometry for the next build.
+        with self._lock:
+            self._cache[name] = (coords, geometry)
+
+    def build(self, zones):
+        with self._lock:
+            cache = {}
+            for name, zone in zones.items():
+                if zone.get('type') != 'gps':
+                    continue
+                coords = zone.get('coords')
+                cached = self._cache.get(name)
+                if cached is not None and (cached[0] is coords or cached[0] == coords):
+                    cache[name] = cached
+                    continue
+                try:
+                    cache[name] = (coords, ZoneGeometry(name, coords))
+                except ValueError as e:
+                    print(f"Warning: skipping zone {name}: {e}")
+            self._cache = cache
+            return ZoneGeometries({name: g for name, (_, g) in cache.items()})
@@ -0,0 +1,79 @@
+import bisect
+import ipaddress
+import socket
+import struct
+
+IPV4 = struct.Struct('!I')
+
+
+def ip_to_int(ip):
+    try:
+        return IPV4.unpack(socket.inet_pton(socket.AF_INET, ip))[0]
+    except (OSError, TypeError):
+        return None
+
+
+def zone_bounds(zone):
+    # ip_range zones use "start"/"end"; "cidr" (or a CIDR in "start") covers a whole network.
+    cidr = zone.get('cidr')
+    if cidr is None and '/' in str(zone.get('start', '')):
+        cidr = zone['start']
+    if cidr is not None:
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        return int(network.network_address), int(network.broadcast_address)
+    lo, hi = ip_to_int(zone.get('start')), ip_to_int(zone.get('end'))
+    if lo is None or hi is None:
+        raise ValueError('invalid ip_range bounds')
+    return min(lo, hi), max(lo, hi)
+
+
+class IPZoneIndex:
+    """Sorted, non-overlapping segments of the IPv4 space, each tagged with the zones covering it."""
+
+    ZONE_TYPES = ('ip_range', 'cidr')
+
+    def __init__(self, zones):
+        intervals = []
+        for order, (name, zone) in enumerate(zones.items()):
+            if zone.get('type') not in self.ZONE_TYPES:
+                continue
+            try:
+                lo, hi = zone_bounds(zone)
+            except (ValueError, TypeError):
+                print(f"Warning: skipping zone {name} with invalid range.")
+                continue
+            intervals.append((lo, hi, order, name))
+        self.size = len(intervals)
+        self._starts, self._matches = self._compile(intervals)
+
+    @staticmethod
+    def _compile(intervals):
+        # Sweep over every boundary; each segment stores the zones active across it,
+        # in zones.json order so the first match keeps the old get_zone() semantics.
+        events = {}
+        for lo, hi, order, name in intervals:
+            events.setdefault(lo, []).append((True, order, name))
+            events.setdefault(hi + 1, []).append((False, order, name))
+        starts, matches = [], []
+        active = {}
+        interned = {}
+        for point in sorted(events):
+            for opening, order, name in events[point]:
+                if opening:
+                    active[order] = name
+                else:
+                    active.pop(order, None)
+            names = tuple(active[k] for k in sorted(active))
+            names = interned.setdefault(names, names)
+            if matches and matches[-1] == names:
+                continue
+            starts.append(point)
+            matches.append(names)
+        return starts, matches
+
+    def lookup(self, ip):
+        value = ip_to_int(ip) if isinstance(ip, str) else ip
+        if value is None:
+            return ()
+        i = bisect.bisect_right(self._starts, value) - 1
+        return self._matches[i] if i >= 0 else ()